@@ -1,24 +1,305 @@
 import time
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file, url_for
 from flask_cors import CORS
-import subprocess
-import hashlib
 import os
+import csv
+import fcntl
+import hashlib
+import io
+import shutil
+import tempfile
 import pandas as pd
 import logging
-import reedsolo
+import archive
+import blockindex
+import cache
+import ingest
+import jobs
+import metrics
+import parallel
+import profiler
+import sharing
+from rs_engine import NumpyRSCodec
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
 logging.basicConfig(level=logging.DEBUG)
 
-# Initialize Reed-Solomon codec
-rs = reedsolo.RSCodec(10)  # 10 is the number of error correction symbols
+# Initialize Reed-Solomon codec (vectorized, byte-compatible with reedsolo.RSCodec)
+rs = NumpyRSCodec(10)  # 10 is the number of error correction symbols
+
+# Worker processes for frame encode/decode (1 keeps everything in the server process)
+RS_WORKERS = int(os.environ.get('RS_WORKERS', os.cpu_count() or 1))
+frame_pool = parallel.FramePool(rs, RS_WORKERS)
+
+# Shamir secret sharing of each upload's key: number of shares and how many recover it
+SHARE_PARTS = int(os.environ.get('SHARE_PARTS', sharing.DEFAULT_PARTS))
+SHARE_THRESHOLD = int(os.environ.get('SHARE_THRESHOLD', sharing.DEFAULT_THRESHOLD))
+
+# Flush the streamed recovery response roughly every 64 KB
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+# Every request and job works in its own directory under WORKSPACE_ROOT.
+# Background jobs: worker threads, max queued + running jobs, seconds finished results are kept
+WORKSPACE_ROOT = os.environ.get('WORKSPACE_ROOT', 'workspaces')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 16))
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+job_manager = jobs.JobManager(WORKSPACE_ROOT, JOB_WORKERS, JOB_MAX_PENDING, JOB_TTL)
+
+# Outputs of the latest synchronous upload, kept for later recovery.  PUBLISH_PATH is a
+# symlink swapped to a fresh directory per upload, so they always come from the same upload.
+PUBLISH_PATH = 'published'
+# Encoded archive, and the block index for Transaction ID range recovery
+ENCODED_OUTPUT_PATH = os.path.join(PUBLISH_PATH, 'encoded_data.bin')
+INDEX_OUTPUT_PATH = os.path.join(PUBLISH_PATH, 'encoded_data.idx')
+# Encrypted upload; any SHARE_THRESHOLD of its key shares decrypt it.
+# The shares themselves are only returned to the uploader, never stored.
+ENCRYPTED_OUTPUT_PATH = os.path.join(PUBLISH_PATH, 'transactions.csv.enc')
+
+# RS blocks per indexed segment (must divide the archive frame size)
+INDEX_SEGMENT_BLOCKS = int(os.environ.get('INDEX_SEGMENT_BLOCKS', blockindex.DEFAULT_SEGMENT_BLOCKS))
+
+# Content-addressed cache of processing results; CACHE_MAX_BYTES=0 disables it
+CACHE_ROOT = os.environ.get('CACHE_ROOT', 'cache')
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 1024 ** 3))
+result_cache = cache.ResultCache(CACHE_ROOT, CACHE_MAX_BYTES)
+
+# Requests sent with "X-Profile: <PROFILE_TOKEN>" are sampled every PROFILE_INTERVAL seconds;
+# an empty token disables profiling
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', profiler.DEFAULT_INTERVAL))
+profiles = profiler.ProfileStore()
+
+metrics.registry.add_collector('casino_cache_hits_total', 'Result cache hits.', 'counter', lambda: result_cache.hits)
+metrics.registry.add_collector('casino_cache_misses_total', 'Result cache misses.', 'counter', lambda: result_cache.misses)
+metrics.registry.add_collector('casino_cache_evictions_total', 'Result cache evictions.', 'counter', lambda: result_cache.evictions)
+metrics.registry.add_collector('casino_cache_bytes', 'Bytes held by the result cache.', 'gauge', lambda: result_cache.stats()['bytes'])
+
+# Upload copy buffer size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Typed columnar copy written by process jobs: '' (none), 'npz' or 'parquet'
+COLUMNAR_FORMAT = os.environ.get('COLUMNAR_FORMAT', '')
+
+
+class TransactionError(Exception):
+    """A processing failure that should be reported with the given HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_file(file_path, workspace, columnar_format=''):
+    """Validate, encode and index the CSV at ``file_path``, writing results into ``workspace``.
+
+    With ``columnar_format`` ('npz' or 'parquet') a typed columnar copy is
+    written to the workspace as well.
+    """
+    columnar_path = os.path.join(workspace, f'transactions.{columnar_format}') if columnar_format else None
+    try:
+        # Header is checked from the first line before the body is streamed for stats
+        with metrics.stage('scan') as counts:
+            stats = ingest.scan(file_path, columnar_path=columnar_path)
+            counts.update(bytes=os.path.getsize(file_path), rows=stats['rows'])
+        print("CSV file scanned successfully")
+    except ingest.SchemaError as e:
+        print(f"CSV validation failed: {e}")
+        raise TransactionError(str(e))
+    transaction_count = stats['rows']
+
+    # Encode data with Reed-Solomon, one frame at a time
+    encoded_path = os.path.join(workspace, 'encoded_data.bin')
+    with metrics.stage('encode') as counts, open(file_path, 'rb') as src, open(encoded_path, 'wb') as dst:
+        counts['bytes'], _ = archive.write_archive(src, dst, rs, pool=frame_pool)
+
+    # Index the archive by Transaction ID; the Merkle root is published with the share hashes
+    index_path = os.path.join(workspace, 'encoded_data.idx')
+    with metrics.stage('index') as counts, open(index_path, 'wb') as dst:
+        merkle_root = blockindex.write_index(file_path, encoded_path, dst, rs, INDEX_SEGMENT_BLOCKS)
+        counts['rows'] = transaction_count
+
+    return {
+        'transaction_count': transaction_count,
+        'merkle_root': merkle_root,
+        'stats': stats,
+        'encoded_path': encoded_path,
+        'index_path': index_path,
+        'columnar_path': columnar_path,
+    }
+
+
+def encode_cached(file_path, digest, workspace, columnar_format=''):
+    """``encode_file`` behind the result cache, keyed by the upload's SHA-256.
+
+    On a hit the cached files are linked into ``workspace`` without
+    re-running encoding.  The result has ``cached`` set accordingly.
+    """
+    key = cache.ResultCache.key(
+        digest, nsym=rs.nsym, nsize=rs.nsize, archive=archive.VERSION, index=blockindex.VERSION,
+        segment_blocks=INDEX_SEGMENT_BLOCKS, columnar=columnar_format)
+    with metrics.stage('cache_lookup'):
+        meta = result_cache.get(key, workspace)
+    if meta is not None:
+        print(f"Cache hit for upload {digest}")
+        return dict(
+            meta['result'], cached=True,
+            encoded_path=os.path.join(workspace, 'encoded_data.bin'),
+            index_path=os.path.join(workspace, 'encoded_data.idx'),
+            columnar_path=os.path.join(workspace, meta['columnar']) if meta['columnar'] else None)
+
+    result = encode_file(file_path, workspace, columnar_format)
+    files = {
+        'encoded_data.bin': result['encoded_path'],
+        'encoded_data.idx': result['index_path'],
+    }
+    columnar = None
+    if result['columnar_path']:
+        columnar = os.path.basename(result['columnar_path'])
+        files[columnar] = result['columnar_path']
+    summary = {key: result[key] for key in ('transaction_count', 'merkle_root', 'stats')}
+    with metrics.stage('cache_store'):
+        result_cache.put(key, files, {'result': summary, 'columnar': columnar})
+    return dict(result, cached=False)
+
+
+def shares_csv(result, key_shares=None):
+    """Render the shares summary: one row per share hash, then the summary rows.
+
+    ``key_shares`` adds the shares themselves as a ``share`` column; that copy
+    is only ever handed to the caller, never written to disk.
+    """
+    summary_data = {
+        'Summary': ['Transactions Processed', 'Processing Time (seconds)', 'Shares Created', 'Merkle Root'],
+        'Value': [result['transaction_count'], f"{result['processing_time']:.2f}", result['share_count'], result['merkle_root']]
+    }
+    summary_df = pd.DataFrame(summary_data)
+
+    shares_df = pd.DataFrame({'share_hashes': result['share_hashes']})
+    if key_shares is not None:
+        shares_df.insert(0, 'share', key_shares)
+    return pd.concat([shares_df, summary_df], ignore_index=True).to_csv(index=False)
+
+
+def process_file(file_path, digest, workspace, columnar_format=''):
+    """Encode the CSV at ``file_path`` (through the result cache) and encrypt it under a fresh key.
+
+    The key is split into Shamir shares in memory.  The shares are returned
+    to the caller as ``key_shares`` and are never written to ``workspace``,
+    the published outputs or the cache; only their hashes go to ``shares.csv``.
+    """
+    start_time = time.time()
+    result = encode_cached(file_path, digest, workspace, columnar_format)
+
+    try:
+        # Split the upload's key into shares in memory
+        with metrics.stage('sharing'):
+            key, key_shares, share_hashes = sharing.create_shares(SHARE_PARTS, SHARE_THRESHOLD)
+    except ValueError as e:
+        print(f"Error during secret sharing: {e}")
+        raise TransactionError('Failed to create key shares', 500)
+
+    # Encrypt the upload with that key; the shares are the only way to decrypt it
+    encrypted_path = os.path.join(workspace, 'transactions.csv.enc')
+    with metrics.stage('encrypt') as counts:
+        counts['bytes'] = sharing.encrypt_file(key, file_path, encrypted_path)
+
+    result.update(
+        processing_time=time.time() - start_time, share_count=len(share_hashes), share_hashes=share_hashes,
+        encrypted_path=encrypted_path, shares_path=os.path.join(workspace, 'shares.csv'))
+    with metrics.stage('write_summary'), open(result['shares_path'], 'w', newline='') as f:
+        f.write(shares_csv(result))
+    return dict(result, key_shares=key_shares)
+
+
+def save_upload(file, path, stage='save'):
+    """Save an uploaded file to ``path``, returning the SHA-256 of its bytes.
+
+    ``stage`` names the timing entry, so requests with several uploads can tell them apart.
+    """
+    digest = hashlib.sha256()
+    with metrics.stage(stage) as counts, open(path, 'wb') as f:
+        while True:
+            chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+        counts['bytes'] = f.tell()
+    return digest.hexdigest()
+
+
+def iter_recovered_csv(decoded, start_time, stats=None):
+    """Re-emit the decoded CSV with the recovery summary appended, one chunk at a time.
+
+    ``stats``, if given, receives the transaction count and processing time.
+    """
+    try:
+        reader = csv.reader(io.TextIOWrapper(decoded, encoding='utf-8', newline=''))
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+
+        header = next(reader, [])
+        writer.writerow(header + ['Summary', 'Value'])
+        transaction_count = 0
+        for row in reader:
+            writer.writerow(row + ['', ''])
+            transaction_count += 1
+            if out.tell() >= RESPONSE_CHUNK_SIZE:
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+
+        # Calculate processing time
+        processing_time = time.time() - start_time
+
+        # Append summary rows in the same layout as the data
+        padding = [''] * len(header)
+        writer.writerow(padding + ['Transactions Recovered', transaction_count])
+        writer.writerow(padding + ['Processing Time (seconds)', f"{processing_time:.2f}"])
+        yield out.getvalue()
+        if stats is not None:
+            stats.update(transaction_count=transaction_count, processing_time=processing_time)
+    finally:
+        decoded.close()
+
+
+def publish(files):
+    """Make ``files`` (published name -> path) the contents of ``PUBLISH_PATH`` as one unit.
+
+    The files are moved into a new directory and the ``PUBLISH_PATH`` symlink
+    is swapped to it with a single ``os.replace``, so readers see either the
+    previous upload's files or these, never a mix.  Publishers, including other
+    server processes, take a lock file around the swap so each one removes
+    exactly the directory it replaced.
+    """
+    parent = os.path.dirname(os.path.abspath(PUBLISH_PATH))
+    target = tempfile.mkdtemp(prefix='.published-', dir=parent)
+    for name, path in files.items():
+        os.replace(path, os.path.join(target, name))
+    link = f'{target}.link'
+    os.symlink(os.path.basename(target), link)
+    with open(f'{PUBLISH_PATH}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        previous = os.path.realpath(PUBLISH_PATH) if os.path.islink(PUBLISH_PATH) else None
+        os.replace(link, PUBLISH_PATH)
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def remove_workspace(workspace):
+    try:
+        shutil.rmtree(workspace)
+        print(f"Removed workspace: {workspace}")
+    except Exception as e:
+        print(f"Failed to remove workspace {workspace}: {e}")
+
+
 
 @app.route('/api/process-transaction', methods=['POST'])
 def process_transaction():
     print("Received a request to /api/process-transaction")
-    output_dir = '/Users/lanxiangzhang/Desktop/Projects/Casino-demo/casino-blockchain-backend/out'
     if 'file' not in request.files:
         print("No file part in the request")
         return jsonify({'error': 'No file part'}), 400
@@ -28,192 +309,372 @@ def process_transaction():
         print("No selected file")
         return jsonify({'error': 'No selected file'}), 400
 
-    upload_dir = 'uploads'
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
-
-    file_path = os.path.join(upload_dir, file.filename)
+    workspace = tempfile.mkdtemp(prefix='process-', dir=WORKSPACE_ROOT)
+    file_path = os.path.join(workspace, 'upload.csv')
     try:
-        file.save(file_path)
+        digest = save_upload(file, file_path)
         print(f"File saved to {file_path}")
     except Exception as e:
         print(f"Failed to save file: {e}")
+        remove_workspace(workspace)
         return jsonify({'error': 'Failed to save file'}), 500
 
     try:
-        df = pd.read_csv(file_path)
-        print("CSV file read successfully")
-
-        required_columns = ['Transaction ID', 'User ID', 'Amount', 'Date', 'Type', 'Game ID', 'Currency', 'Status', 'Payment Method', 'Notes']
-        if not all(column in df.columns for column in required_columns):
-            print("CSV file is missing required columns")
-            return jsonify({'error': 'CSV file is missing required columns'}), 400
-
-        start_time = time.time()
-        try:
-            # Ensure images directory exists
-            images_dir = 'images'
-            if not os.path.exists(images_dir):
-                os.makedirs(images_dir)
-                subprocess.run("stegosecrets images", shell=True, check=True)
-
-            # Use stego CLI to encrypt the file
-            result = subprocess.run(
-                ['stego', 'encrypt', '--file', file_path, '--parts', '5', '--threshold', '3', '--output', output_dir],
-                check=True, capture_output=True, text=True
-            )
-            print("Stego command output:", result.stdout)
-
-            # Read the file content
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-
-            # Encode data with Reed-Solomon
-            encoded_data = rs.encode(file_content)
-            with open('encoded_data.bin', 'wb') as f:
-                f.write(encoded_data)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error during stego command execution: {e.stderr}")
-            return jsonify({'error': 'Failed to process transaction with StegoSecrets'}), 500
-
-        share_hashes = []
-        for i in range(5):
-            key_file = os.path.join(output_dir, f'{i+1:03}.key')
-            if not os.path.exists(key_file):
-                print(f"File not found: {key_file}")
-                return jsonify({'error': f'File not found: {key_file}'}), 500
-            with open(key_file, 'rb') as f:
-                share = f.read()
-                share_hash = hashlib.sha256(share).hexdigest()
-                share_hashes.append(share_hash)
-
-        processing_time = time.time() - start_time
-
-        summary_data = {
-            'Summary': ['Transactions Processed', 'Processing Time (seconds)', 'Shares Created'],
-            'Value': [len(df), f"{processing_time:.2f}", len(share_hashes)]
-        }
-        summary_df = pd.DataFrame(summary_data)
-
-        shares_df = pd.DataFrame({'share_hashes': share_hashes})
-        result_df = pd.concat([shares_df, summary_df], ignore_index=True)
-
-        shares_file_path = 'shares.csv'
-        result_df.to_csv(shares_file_path, index=False)
-
-        response = send_file(shares_file_path, as_attachment=True, download_name='shares.csv')
-        response.headers['X-Transaction-Count'] = str(len(df))
-        response.headers['X-Processing-Time'] = f"{processing_time:.2f}"
-        response.headers['X-Share-Count'] = str(len(share_hashes))
+        result = process_file(file_path, digest, workspace)
+        # Publish this upload's files together so concurrent uploads never interleave
+        with metrics.stage('publish'):
+            publish({
+                os.path.basename(ENCODED_OUTPUT_PATH): result['encoded_path'],
+                os.path.basename(INDEX_OUTPUT_PATH): result['index_path'],
+                os.path.basename(ENCRYPTED_OUTPUT_PATH): result['encrypted_path'],
+            })
+
+        # The key shares go to the uploader only, in this response built in memory
+        body = io.BytesIO(shares_csv(result, result['key_shares']).encode('utf-8'))
+        response = send_file(body, mimetype='text/csv', as_attachment=True, download_name='shares.csv')
+        response.headers['X-Transaction-Count'] = str(result['transaction_count'])
+        response.headers['X-Processing-Time'] = f"{result['processing_time']:.2f}"
+        response.headers['X-Share-Count'] = str(result['share_count'])
+        response.headers['X-Merkle-Root'] = result['merkle_root']
+        response.headers['X-Cache'] = 'HIT' if result['cached'] else 'MISS'
+        logging.info("File processed successfully")
         return response
 
-    except pd.errors.EmptyDataError:
-        print("CSV file is empty or invalid")
-        return jsonify({'error': 'CSV file is empty or invalid'}), 400
+    except TransactionError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         print(f"Unexpected error: {e}")
         return jsonify({'error': 'An unexpected error occurred'}), 500
     finally:
-        for i in range(5):
-            key_file = os.path.join(output_dir, f'{i+1:03}.key')
-            if os.path.exists(key_file):
-                try:
-                    os.remove(key_file)
-                    print(f"Removed key file: {key_file}")
-                except Exception as e:
-                    print(f"Failed to remove key file {key_file}: {e}")
-            image_file = os.path.join(images_dir, f'{i+1}.jpg')
-            if os.path.exists(image_file):
-                try:
-                    os.remove(image_file)
-                    print(f"Removed image file: {image_file}")
-                except Exception as e:
-                    print(f"Failed to remove image file {image_file}: {e}")
-
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                print(f"Removed file: {file_path}")
-            except Exception as e:
-                print(f"Failed to remove file {file_path}: {e}")
-
-        if os.path.exists('uploaded_transaction.csv.enc'):
-            try:
-                os.remove('uploaded_transaction.csv.enc')
-                print("Removed file: uploaded_transaction.csv.enc")
-            except Exception as e:
-                print(f"Failed to remove file uploaded_transaction.csv.enc: {e}")
-
-        if os.path.exists('uploaded_transaction.csv.key'):
-            try:
-                os.remove('uploaded_transaction.csv.key')
-                print("Removed file: uploaded_transaction.csv.key")
-            except Exception as e:
-                print(f"Failed to remove file uploaded_transaction.csv.key: {e}")
-
-    logging.info("File processed successfully")
-    return jsonify({'shares': share_hashes, 'processing_time': processing_time})
+        remove_workspace(workspace)
 
-@app.route('/api/recover-transaction', methods=['POST'])
-def recover_transaction():
-    start_time = time.time()
+def parse_id_range(form):
+    """Return ``(start_id, end_id)`` from the form; a missing bound leaves that side open."""
     try:
-        # Get the uploaded files
-        encoded_file = request.files.get('file')
-        encoded_file_path = 'encoded_data.bin'
-        encoded_file.save(encoded_file_path)
-
-        # Decode data with Reed-Solomon
-        with open(encoded_file_path, 'rb') as f:
-            encoded_data = f.read()
+        start_id = int(form['start_id']) if form.get('start_id') else blockindex.MIN_ID
+        end_id = int(form['end_id']) if form.get('end_id') else blockindex.MAX_ID
+    except ValueError:
+        raise TransactionError('start_id and end_id must be integers')
+    if start_id > end_id:
+        raise TransactionError('start_id must not be greater than end_id')
+    return start_id, end_id
 
-        # Decode the data
-        decoded_data = rs.decode(encoded_data)
 
-        # If rs.decode() returns more than one value, adjust accordingly
-        if isinstance(decoded_data, tuple):
-            decoded_data = decoded_data[0]
-
-        # Save the decoded data to a file
-        recovered_file_path = 'recovered_transaction.csv'
-        with open(recovered_file_path, 'wb') as f:
-            f.write(decoded_data)
-
-        # Calculate processing time
-        processing_time = time.time() - start_time
+def parse_merkle_root(form):
+    try:
+        root = bytes.fromhex(form.get('merkle_root', ''))
+    except ValueError:
+        root = b''
+    if len(root) != blockindex.HASH_SIZE:
+        raise TransactionError('merkle_root must be the 64-character hex root from shares.csv')
+    return root
 
-        # Count transactions
-        df = pd.read_csv(recovered_file_path)
-        transaction_count = len(df)
 
-        # Add summary information to the DataFrame
-        summary_data = {
-            'Summary': ['Transactions Recovered', 'Processing Time (seconds)'],
-            'Value': [transaction_count, f"{processing_time:.2f}"]
-        }
-        summary_df = pd.DataFrame(summary_data)
+def recover_range():
+    """Recover only the rows in a Transaction ID range, reading just the segments that hold them."""
+    start_time = time.time()
+    try:
+        start_id, end_id = parse_id_range(request.form)
+        root = parse_merkle_root(request.form)
+        if 'file' not in request.files or 'index' not in request.files:
+            raise TransactionError('Range recovery needs the encoded file and its index')
+    except TransactionError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    workspace = tempfile.mkdtemp(prefix='recover-', dir=WORKSPACE_ROOT)
+    try:
+        encoded_file_path = os.path.join(workspace, 'encoded_data.bin')
+        index_path = os.path.join(workspace, 'encoded_data.idx')
+        save_upload(request.files['file'], encoded_file_path, 'save_archive')
+        save_upload(request.files['index'], index_path, 'save_index')
+
+        # Checks the index and every segment involved before any of the response is sent
+        stats = {}
+        with metrics.stage('range_verify') as counts:
+            decoded = blockindex.open_range(
+                open(index_path, 'rb'), open(encoded_file_path, 'rb'), rs, root, start_id, end_id, stats)
+            counts['bytes'] = os.path.getsize(encoded_file_path)
+    except (blockindex.BlockIndexError, archive.ArchiveError) as e:
+        print(f"Range recovery rejected: {e}")
+        remove_workspace(workspace)
+        return jsonify({'error': str(e)}), 422
+    except Exception as e:
+        print(f"Error during recovery: {e}")
+        remove_workspace(workspace)
+        return jsonify({'error': 'Failed to recover file'}), 500
 
-        # Append summary to the original data
-        result_df = pd.concat([df, summary_df], ignore_index=True)
+    def generate():
+        # Matching rows are decoded segment by segment as the response streams
+        stream_start = time.perf_counter()
+        try:
+            yield from iter_recovered_csv(decoded, start_time)
+            metrics.registry.record(
+                'recover_transaction', 'range_stream', time.perf_counter() - stream_start, rows=stats['rows'])
+        finally:
+            remove_workspace(workspace)
+
+    return Response(
+        generate(),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': 'attachment; filename=recovered_transaction.csv',
+            'X-Segments-Decoded': str(stats['segments']),
+            'X-Segments-Repaired': str(stats['repaired']),
+        },
+    )
 
-        # Save the updated DataFrame to the CSV
-        result_df.to_csv(recovered_file_path, index=False)
+@app.route('/api/recover-transaction', methods=['POST'])
+def recover_transaction():
+    # A Transaction ID range switches to indexed, verified partial recovery
+    if request.form.get('start_id') or request.form.get('end_id'):
+        return recover_range()
 
-        # Return the recovered file
-        return send_file(recovered_file_path, as_attachment=True, download_name='recovered_transaction.csv')
+    if 'file' not in request.files:
+        print("No file part in the request")
+        return jsonify({'error': 'No file part'}), 400
 
+    start_time = time.time()
+    workspace = tempfile.mkdtemp(prefix='recover-', dir=WORKSPACE_ROOT)
+    decoded = None
+    try:
+        # Get the uploaded files
+        encoded_file = request.files['file']
+        encoded_file_path = os.path.join(workspace, 'encoded_data.bin')
+        save_upload(encoded_file, encoded_file_path)
+
+        # Decode data with Reed-Solomon; frames are decoded lazily as the response streams
+        with metrics.stage('open_archive'):
+            decoded = archive.open_decoded(open(encoded_file_path, 'rb'), rs, frame_pool)
+            # Decode the first chunk now so an undecodable upload still gets a JSON error
+            decoded.peek()
     except Exception as e:
         print(f"Error during recovery: {e}")
+        if decoded is not None:
+            decoded.close()
+        remove_workspace(workspace)
         return jsonify({'error': 'Failed to recover file'}), 500
+
+    def generate():
+        # Runs after the response headers are sent, so it reports to /api/metrics only
+        stream_start = time.perf_counter()
+        stats = {}
+        try:
+            yield from iter_recovered_csv(decoded, start_time, stats)
+            metrics.registry.record(
+                'recover_transaction', 'decode_stream', time.perf_counter() - stream_start,
+                bytes=os.path.getsize(encoded_file_path), rows=stats['transaction_count'])
+        except Exception as e:
+            print(f"Error during recovery: {e}")
+            raise
+        finally:
+            # Clean up temporary files
+            remove_workspace(workspace)
+
+    # Return the recovered file
+    return Response(
+        generate(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=recovered_transaction.csv'},
+    )
+
+def read_key_shares(form, files):
+    """Collect key shares from repeated ``share`` fields and/or an uploaded ``key_shares`` CSV.
+
+    The CSV is the ``shares.csv`` returned by processing (or any CSV with a ``share`` column).
+    """
+    shares = [share.strip() for share in form.getlist('share') if share.strip()]
+    if 'key_shares' in files:
+        text = io.TextIOWrapper(files['key_shares'].stream, encoding='utf-8-sig', newline='')
+        try:
+            shares.extend(row['share'].strip() for row in csv.DictReader(text) if (row.get('share') or '').strip())
+        except UnicodeDecodeError:
+            raise TransactionError('key_shares must be the shares.csv returned by processing')
+    if len(shares) < 2:
+        raise TransactionError('At least two key shares are required')
+    return shares
+
+@app.route('/api/decrypt-transaction', methods=['POST'])
+def decrypt_transaction():
+    """Rebuild the key from its shares and return the decrypted upload."""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    try:
+        shares = read_key_shares(request.form, request.files)
+    except TransactionError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    workspace = tempfile.mkdtemp(prefix='decrypt-', dir=WORKSPACE_ROOT)
+    try:
+        encrypted_path = os.path.join(workspace, 'transactions.csv.enc')
+        decrypted_path = os.path.join(workspace, 'transactions.csv')
+        save_upload(request.files['file'], encrypted_path)
+        with metrics.stage('decrypt') as counts:
+            sharing.decrypt_file(sharing.recover_key(shares), encrypted_path, decrypted_path)
+            counts['bytes'] = os.path.getsize(decrypted_path)
+    except sharing.DecryptionError as e:
+        print(f"Decryption rejected: {e}")
+        remove_workspace(workspace)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error during decryption: {e}")
+        remove_workspace(workspace)
+        return jsonify({'error': 'Failed to decrypt file'}), 500
+
+    def generate():
+        try:
+            with open(decrypted_path, 'rb') as f:
+                while True:
+                    chunk = f.read(RESPONSE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            remove_workspace(workspace)
+
+    return Response(
+        generate(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=decrypted_transaction.csv'},
+    )
+
+def run_instrumented(job, runner):
+    """Run ``runner(job)`` with its own stage timer and keep the timings on the job."""
+    timer = metrics.start(f'{job.kind}_job')
+    try:
+        runner(job)
     finally:
-        # Clean up temporary files
-        if os.path.exists(encoded_file_path):
-            try:
-                os.remove(encoded_file_path)
-                print(f"Removed file: {encoded_file_path}")
-            except Exception as e:
-                print(f"Failed to remove file {encoded_file_path}: {e}")
+        metrics.finish()
+        job.result['timings'] = {name: seconds for name, seconds in timer.stages}
+
+def run_process_job(job):
+    result = process_file(
+        os.path.join(job.workspace, 'upload.csv'), job.result['upload_sha256'], job.workspace, COLUMNAR_FORMAT)
+    job.result.update({key: result[key] for key in (
+        'transaction_count', 'processing_time', 'share_count', 'merkle_root', 'stats', 'cached')})
+    job.artifacts = {
+        'shares': (result['shares_path'], 'shares.csv'),
+        'encoded': (result['encoded_path'], 'encoded_data.bin'),
+        'index': (result['index_path'], 'encoded_data.idx'),
+        'encrypted': (result['encrypted_path'], 'transactions.csv.enc'),
+    }
+    # Kept in memory and handed out by the first download only
+    job.one_shot['key_shares'] = (shares_csv(result, result['key_shares']).encode('utf-8'), 'key_shares.csv')
+    if result['columnar_path']:
+        job.artifacts['columnar'] = (result['columnar_path'], os.path.basename(result['columnar_path']))
+
+def run_recover_job(job):
+    start_time = time.time()
+    recovered_path = os.path.join(job.workspace, 'recovered_transaction.csv')
+    decoded = archive.open_decoded(open(os.path.join(job.workspace, 'encoded_data.bin'), 'rb'), rs, frame_pool)
+    stats = {}
+    with metrics.stage('decode') as counts, open(recovered_path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in iter_recovered_csv(decoded, start_time, stats):
+            f.write(chunk)
+        counts['rows'] = stats['transaction_count']
+    job.result.update(stats)
+    job.artifacts = {'recovered': (recovered_path, 'recovered_transaction.csv')}
+
+# Job kind -> (upload file name inside the workspace, runner, default artifact)
+JOB_KINDS = {
+    'process': ('upload.csv', run_process_job, 'shares'),
+    'recover': ('encoded_data.bin', run_recover_job, 'recovered'),
+}
+
+def submit_job(kind):
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file part'}), 400
+
+    upload_name, runner, _ = JOB_KINDS[kind]
+    try:
+        job = job_manager.reserve(kind)
+    except jobs.JobQueueFull as e:
+        print(f"Rejected {kind} job: {e}")
+        return jsonify({'error': 'Too many pending jobs, please retry later'}), 429, {'Retry-After': '5'}
+
+    try:
+        job.result['upload_sha256'] = save_upload(file, os.path.join(job.workspace, upload_name))
+    except Exception as e:
+        print(f"Failed to save file: {e}")
+        job_manager.discard(job)
+        return jsonify({'error': 'Failed to save file'}), 500
+
+    job_manager.start(job, lambda job: run_instrumented(job, runner))
+    return jsonify(job.to_dict()), 202, {'Location': url_for('job_status', job_id=job.id)}
+
+@app.route('/api/jobs/process-transaction', methods=['POST'])
+def submit_process_job():
+    return submit_job('process')
+
+@app.route('/api/jobs/recover-transaction', methods=['POST'])
+def submit_recover_job():
+    return submit_job('recover')
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+@app.route('/api/jobs/<job_id>/result/<artifact>', methods=['GET'])
+def job_result(job_id, artifact=None):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status != jobs.DONE:
+        return jsonify(job.to_dict()), 409
+
+    artifact = artifact or JOB_KINDS[job.kind][2]
+    one_shot = job.one_shot.pop(artifact, None)
+    if one_shot is not None:
+        data, download_name = one_shot
+        return send_file(io.BytesIO(data), mimetype='text/csv', as_attachment=True, download_name=download_name)
+    if artifact not in job.artifacts:
+        return jsonify({'error': f'Unknown artifact: {artifact}'}), 404
+    path, download_name = job.artifacts[artifact]
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=download_name)
+
+@app.before_request
+def start_instrumentation():
+    metrics.start(request.endpoint or 'unknown')
+    if PROFILE_TOKEN and request.headers.get('X-Profile') == PROFILE_TOKEN:
+        g.profiler = profiler.SamplingProfiler(PROFILE_INTERVAL).start()
+
+@app.after_request
+def add_server_timing(response):
+    timer = metrics.finish()
+    if timer is not None:
+        response.headers['Server-Timing'] = timer.server_timing()
+    sampler = g.pop('profiler', None)
+    if sampler is not None:
+        if response.direct_passthrough:
+            # send_file bodies: the work is done, and werkzeug never runs their close callbacks
+            profiles.add(sampler.stop())
+        else:
+            # Streamed responses do their work after this hook, so keep sampling until the body is sent
+            response.call_on_close(lambda: profiles.add(sampler.stop()))
+        response.headers['X-Profile-Id'] = sampler.id
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    if not PROFILE_TOKEN or request.headers.get('X-Profile') != PROFILE_TOKEN:
+        return jsonify({'error': 'Profiling is not enabled'}), 403
+    sampler = profiles.get(profile_id)
+    if sampler is None:
+        return jsonify({'error': 'Unknown profile'}), 404
+    # Collapsed stacks, ready for flamegraph.pl or speedscope
+    return Response(sampler.collapsed(), mimetype='text/plain')
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,89 @@
+"""Throughput comparison between reedsolo.RSCodec and rs_engine.NumpyRSCodec.
+
+Usage:
+    python benchmarks/bench_codec.py --size-mb 4 --corrupt 0.001
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import reedsolo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import archive  # noqa: E402
+from rs_engine import NumpyRSCodec  # noqa: E402
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def corrupt(data, rate, nsize, seed=0):
+    # Flip a few bytes in a random subset of blocks, staying within the correction capacity
+    rng = random.Random(seed)
+    damaged = bytearray(data)
+    blocks = (len(damaged) + nsize - 1) // nsize
+    for block in rng.sample(range(blocks), int(blocks * rate)):
+        pos = block * nsize + rng.randrange(min(nsize, len(damaged) - block * nsize))
+        damaged[pos] ^= 0xFF
+    return damaged
+
+
+def check_checksum_collision(codec):
+    """Regression check: damage the per-block checksums cannot see must still be repaired.
+
+    +1, -2, +1 on three adjacent bytes leaves both mod-65521 sums unchanged,
+    so the checksum fast path treats the block as clean; the archive decoder
+    has to fall back to a full syndrome pass.
+    """
+    payload = bytes(range(256)) * 64
+    header, encoded = archive.encode_frame(codec, payload)
+    damaged = bytearray(encoded)
+    for offset, delta in ((40, 1), (41, -2), (42, 1)):
+        damaged[offset] = (damaged[offset] + delta) % 256
+    raw_len, _, crc = archive._FRAME.unpack_from(header)
+    checksums = np.frombuffer(header[archive._FRAME.size:], dtype='>u4').astype(np.uint32)
+    if archive.decode_frame(codec, bytes(damaged), checksums, raw_len, crc) != payload:
+        raise SystemExit('archive decode missed damage hidden from the block checksums')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=1.0, help='payload size in MiB')
+    parser.add_argument('--nsym', type=int, default=10, help='ECC symbols per block')
+    parser.add_argument('--corrupt', type=float, default=0.001, help='fraction of blocks to damage before decoding')
+    parser.add_argument('--skip-reedsolo', action='store_true', help='only time the NumPy engine')
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    mb = len(payload) / (1024 * 1024)
+    fast = NumpyRSCodec(args.nsym)
+    check_checksum_collision(fast)
+    codecs = [('numpy', fast)]
+    if not args.skip_reedsolo:
+        codecs.insert(0, ('reedsolo', reedsolo.RSCodec(args.nsym)))
+
+    reference = None
+    print(f"{'codec':<10} {'encode MB/s':>12} {'decode MB/s':>12}")
+    for name, codec in codecs:
+        encoded, encode_time = timed(codec.encode, payload)
+        if reference is None:
+            reference = encoded
+        elif encoded != reference:
+            raise SystemExit(f'{name} output differs from reedsolo')
+
+        damaged = corrupt(encoded, args.corrupt, fast.nsize)
+        decoded, decode_time = timed(codec.decode, damaged)
+        if decoded[0] != payload:
+            raise SystemExit(f'{name} failed to recover the payload')
+
+        print(f'{name:<10} {mb / encode_time:>12.2f} {mb / decode_time:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""End-to-end benchmark of /api/process-transaction and /api/recover-transaction.
+
+Drives the Flask app through its test client over a matrix of CSV sizes and
+injected corruption rates, and reports throughput, latency percentiles and
+peak RSS.  Each endpoint of each case runs in a fresh process, so peak RSS
+belongs to that endpoint alone; the codec worker processes are reported
+separately, as the peak of the largest one.  The result cache is disabled so
+every request does the full work.
+
+Usage:
+    python benchmarks/bench_endpoints.py --rows 10000 100000 --corrupt 0 0.01 --repeat 5
+    python benchmarks/bench_endpoints.py --save-baseline   # record benchmarks/baseline.json
+    python benchmarks/bench_endpoints.py --tolerance 0.2    # exit 1 if >20% worse than baseline
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(BACKEND_DIR))
+
+import generate_transactions  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak RSS of this process, or with ``RUSAGE_CHILDREN`` of its largest reaped child."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def corrupt_archive(data, rate, seed):
+    """Flip one byte in each RS block chosen with probability ``rate``, staying correctable."""
+    import archive
+    from rs_engine import NumpyRSCodec
+
+    codec = NumpyRSCodec(10)
+    rng = random.Random(seed)
+    damaged = bytearray(data)
+    for offset, length in archive.payload_spans(io.BytesIO(data), codec):
+        for block_start in range(offset, offset + length, codec.nsize):
+            if rng.random() < rate:
+                block_len = min(codec.nsize, offset + length - block_start)
+                damaged[block_start + rng.randrange(block_len)] ^= 0xFF
+    return bytes(damaged)
+
+
+def summarize(endpoint, latencies, size):
+    latencies = np.array(latencies)
+    return {
+        'endpoint': endpoint,
+        'bytes': size,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'throughput_mb_s': size / (1024 * 1024) / float(np.median(latencies)),
+    }
+
+
+def run_endpoint(endpoint, upload, rows, repeat, workdir, results):
+    """Child process entry point; always reports ``('ok', result)`` or ``('error', traceback)``."""
+    try:
+        results.put(('ok', time_endpoint(endpoint, upload, rows, repeat, workdir)))
+    except BaseException:
+        results.put(('error', traceback.format_exc()))
+
+
+def time_endpoint(endpoint, upload, rows, repeat, workdir):
+    """Time ``repeat`` requests to one endpoint with ``upload``, streamed from disk.
+
+    After timing ``process`` the published archive is copied to
+    ``workdir/archive.bin`` for the recover run.
+    """
+    os.environ['CACHE_MAX_BYTES'] = '0'
+    os.environ['WORKSPACE_ROOT'] = os.path.join(workdir, 'workspaces')
+    os.chdir(workdir)
+    import SecretSharingAndEncoding as backend
+
+    client = backend.app.test_client()
+    expected = f'Transactions Recovered,{rows}'.encode()
+    latencies = []
+    for _ in range(repeat):
+        with open(upload, 'rb') as f:
+            start = time.perf_counter()
+            response = client.post(f'/api/{endpoint}-transaction', data={'file': (f, os.path.basename(upload))})
+            # Keep only the tail, so the benchmark itself does not hold the recovered file
+            tail = b''
+            for chunk in response.iter_encoded():
+                tail = (tail + chunk)[-200:]
+            response.close()
+            latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f'{endpoint}-transaction returned {response.status_code}')
+        if endpoint == 'recover' and expected not in tail:
+            raise RuntimeError('recover-transaction did not return the original transactions')
+
+    # Shutting the pool down reaps the codec workers, so RUSAGE_CHILDREN covers them
+    backend.frame_pool.shutdown()
+    backend.job_manager.shutdown()
+    result = summarize(endpoint, latencies, os.path.getsize(upload))
+    result.update(peak_rss_mb=peak_rss_mb(), worker_rss_mb=peak_rss_mb(resource.RUSAGE_CHILDREN))
+    if endpoint == 'process':
+        shutil.copyfile(backend.ENCODED_OUTPUT_PATH, os.path.join(workdir, 'archive.bin'))
+    return result
+
+
+def run_child(context, endpoint, upload, rows, repeat, workdir):
+    """Run ``time_endpoint`` in a fresh process and return its result, exiting on failure."""
+    reports = context.Queue()
+    child = context.Process(target=run_endpoint, args=(endpoint, upload, rows, repeat, workdir, reports))
+    child.start()
+    status, report = wait_for(child, reports)
+    child.join()
+    if status != 'ok':
+        sys.exit(f'Case {endpoint} rows={rows} failed:\n{report}')
+    return report
+
+
+def wait_for(child, results):
+    """Return the child's report, or an error once it has died without sending one."""
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not child.is_alive():
+                try:
+                    return results.get(timeout=1)
+                except queue.Empty:
+                    return 'error', f'benchmark process exited with code {child.exitcode}'
+
+
+def case_key(result):
+    return f"{result['endpoint']}:{result['rows']}:{result['corrupt']}"
+
+
+def compare(results, baseline, tolerance):
+    """Return messages for cases that are slower or use more memory than the baseline allows."""
+    regressions = []
+    for result in results:
+        base = baseline.get(case_key(result))
+        if base is None:
+            continue
+        if result['throughput_mb_s'] < base['throughput_mb_s'] * (1 - tolerance):
+            regressions.append(f"{case_key(result)} throughput {result['throughput_mb_s']:.2f} MB/s "
+                               f"vs baseline {base['throughput_mb_s']:.2f} MB/s")
+        for field, label in (('peak_rss_mb', 'peak RSS'), ('worker_rss_mb', 'worker RSS')):
+            if field in base and result[field] > base[field] * (1 + tolerance):
+                regressions.append(f"{case_key(result)} {label} {result[field]:.0f} MB "
+                                   f"vs baseline {base[field]:.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='CSV sizes in rows')
+    parser.add_argument('--corrupt', type=float, nargs='+', default=[0.0, 0.01],
+                        help='fraction of RS blocks damaged before recovery')
+    parser.add_argument('--repeat', type=int, default=5, help='requests per endpoint and case')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON path')
+    parser.add_argument('--save-baseline', action='store_true', help='write these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression vs the baseline')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        for rows in args.rows:
+            csv_path = os.path.join(workdir, f'transactions_{rows}.csv')
+            generate_transactions.generate(rows, csv_path, seed=args.seed)
+            for rate in args.corrupt:
+                case_dir = tempfile.mkdtemp(dir=workdir)
+                process = run_child(context, 'process', csv_path, rows, args.repeat, case_dir)
+
+                damaged_path = os.path.join(case_dir, 'damaged.bin')
+                with open(os.path.join(case_dir, 'archive.bin'), 'rb') as f:
+                    damaged = corrupt_archive(f.read(), rate, args.seed)
+                with open(damaged_path, 'wb') as f:
+                    f.write(damaged)
+                del damaged
+                recover = run_child(context, 'recover', damaged_path, rows, args.repeat, case_dir)
+                results.extend(dict(result, rows=rows, corrupt=rate) for result in (process, recover))
+
+    print(f"{'endpoint':<10} {'rows':>9} {'corrupt':>8} {'MB/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'RSS MB':>8} {'worker MB':>10}")
+    for r in results:
+        print(f"{r['endpoint']:<10} {r['rows']:>9} {r['corrupt']:>8} {r['throughput_mb_s']:>8.2f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['peak_rss_mb']:>8.0f} "
+              f"{r['worker_rss_mb']:>10.0f}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({case_key(r): r for r in results}, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+"""Side index of an encoded archive for verified Transaction ID range lookups.
+
+The archive payload is cut into segments of ``segment_blocks`` RS blocks.
+For each segment the index records where its plaintext and its encoded bytes
+live, the offset of the first CSV row starting in it and the smallest and
+largest Transaction ID of the rows starting in it.  A Merkle tree over the
+segments (each leaf hashes the entry together with the segment's encoded
+bytes) authenticates the data.  The published root, written to ``shares.csv``,
+commits to that tree's root and to a hash of the whole header and entry table,
+so the entries used to choose segments are checked before they are trusted.
+
+Layout (all integers big-endian)::
+
+    header   magic "CSRSIDX" | version u8 | nsym u8 | nsize u8 | segment_blocks u32 | segments u32
+    entries  ENTRY * segments
+    tree     SHA-256 nodes, leaves first, one level after another up to the root
+
+``open_range`` checks the entry table, looks up the segments whose ID range
+overlaps the request, checks each of them against the tree with its Merkle
+path (repairing with the RS parity only if that check fails), and then
+streams the matching rows one segment at a time.
+"""
+import contextlib
+import csv
+import hashlib
+import hmac
+import io
+import struct
+
+import numpy as np
+
+import archive
+
+MAGIC = b'CSRSIDX'
+VERSION = 2
+DEFAULT_SEGMENT_BLOCKS = 16  # ~3.5 KB of CSV per segment with RSCodec(10)
+ID_COLUMN = 'Transaction ID'
+
+_HEADER = struct.Struct('>7sBBBII')
+ENTRY = np.dtype([
+    ('raw_offset', '>u8'), ('raw_len', '>u4'), ('first_row', '>u8'),
+    ('archive_offset', '>u8'), ('encoded_len', '>u4'), ('min_id', '>i8'), ('max_id', '>i8'),
+])
+HASH_SIZE = 32
+
+# Bounds of a Transaction ID; segments without IDs get min_id=MAX_ID, max_id=MIN_ID
+MIN_ID = int(np.iinfo(np.int64).min)
+MAX_ID = int(np.iinfo(np.int64).max)
+
+# Row starts and IDs are folded into the entries this many rows at a time
+_BATCH_ROWS = 100000
+
+
+class BlockIndexError(Exception):
+    pass
+
+
+def _leaf_hash(entry, encoded):
+    return hashlib.sha256(b'\x00' + entry + encoded).digest()
+
+
+def _node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _tree_levels(leaves):
+    """All levels of the Merkle tree, leaves first; an unpaired node moves up unchanged."""
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([_node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                       for i in range(0, len(level), 2)])
+    return levels
+
+
+def _level_sizes(count):
+    sizes = [count]
+    while sizes[-1] > 1:
+        sizes.append(-(-sizes[-1] // 2))
+    return sizes
+
+
+def _empty_root():
+    return hashlib.sha256(b'').digest()
+
+
+def _commit(table, tree_root):
+    """Published root: binds the header and entry table bytes to the segment tree's root."""
+    return hashlib.sha256(b'\x02' + hashlib.sha256(table).digest() + tree_root).digest()
+
+
+def _id_column(header):
+    # Excel exports start with a byte order mark, which the csv module keeps
+    names = [name.lstrip('\ufeff') for name in header]
+    if ID_COLUMN not in names:
+        raise BlockIndexError(f'CSV has no {ID_COLUMN!r} column')
+    return names.index(ID_COLUMN)
+
+
+def _read_exact(src, size):
+    data = src.read(size)
+    if len(data) != size:
+        raise BlockIndexError('Block index is truncated')
+    return data
+
+
+def _encoded_size(codec, raw_len):
+    return raw_len + codec.nsym * -(-raw_len // codec.k)
+
+
+class _LineTracker(object):
+    """Feeds a binary file to ``csv.reader`` line by line, remembering where each line started."""
+
+    def __init__(self, f, offset=0):
+        self._f = f
+        self.position = offset
+        self.starts = []
+
+    def __iter__(self):
+        for line in self._f:
+            self.starts.append(self.position)
+            self.position += len(line)
+            yield line.decode('utf-8')
+
+
+def _records(f, offset=0):
+    """Yield ``(start, end, row)`` for each CSV record in ``f``, with byte offsets.
+
+    Quoted fields may contain newlines, so a record can span several lines.
+    """
+    lines = _LineTracker(f, offset)
+    for row in csv.reader(lines):
+        yield lines.starts[0], lines.position, row
+        del lines.starts[:]
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _scan_rows(csv_path, entries, segment_raw):
+    # Fill first_row/min_id/max_id from the data rows of the CSV
+    def flush(starts, ids):
+        starts = np.asarray(starts, dtype=np.int64)
+        segments = starts // segment_raw
+        np.minimum.at(first_row, segments, starts)
+        ids = np.asarray(ids, dtype=object)
+        has_id = np.array([value is not None for value in ids], dtype=bool)
+        if has_id.any():
+            values = ids[has_id].astype(np.int64)
+            np.minimum.at(min_id, segments[has_id], values)
+            np.maximum.at(max_id, segments[has_id], values)
+
+    first_row = entries['first_row'].astype(np.int64)
+    min_id = entries['min_id'].astype(np.int64)
+    max_id = entries['max_id'].astype(np.int64)
+    with open(csv_path, 'rb') as f:
+        records = _records(f)
+        _, _, header = next(records, (0, 0, []))
+        column = _id_column(header)
+        starts, ids = [], []
+        for start, _, row in records:
+            starts.append(start)
+            ids.append(_parse_id(row[column]) if column < len(row) else None)
+            if len(starts) >= _BATCH_ROWS:
+                flush(starts, ids)
+                starts, ids = [], []
+        if starts:
+            flush(starts, ids)
+
+    # Segments where no row starts point at the next row start after them
+    entries['first_row'] = np.minimum.accumulate(first_row[::-1])[::-1]
+    entries['min_id'] = min_id
+    entries['max_id'] = max_id
+
+
+def write_index(csv_path, archive_path, dst, codec, segment_blocks=DEFAULT_SEGMENT_BLOCKS):
+    """Index the archive at ``archive_path`` encoded from ``csv_path`` into the file object ``dst``.
+
+    Returns the published root (see ``_commit``) as a hex string.
+    """
+    with open(archive_path, 'rb') as src:
+        _, frame_blocks = archive.read_header(src, codec)
+        src.seek(0)
+        if frame_blocks % segment_blocks:
+            raise BlockIndexError(f'segment_blocks={segment_blocks} does not divide frame_blocks={frame_blocks}')
+        spans = list(archive.payload_spans(src, codec))
+
+    segment_raw = segment_blocks * codec.k
+    segments_per_frame = frame_blocks // segment_blocks
+    raw_total = sum(length for _, length in spans) - codec.nsym * sum(
+        -(-length // codec.nsize) for _, length in spans)
+    count = -(-raw_total // segment_raw)
+
+    entries = np.zeros(count, dtype=ENTRY)
+    number = np.arange(count, dtype=np.int64)
+    entries['raw_offset'] = number * segment_raw
+    entries['raw_len'] = np.minimum(segment_raw, raw_total - number * segment_raw)
+    entries['first_row'] = raw_total
+    entries['min_id'] = MAX_ID
+    entries['max_id'] = MIN_ID
+    frame_offsets = np.array([offset for offset, _ in spans], dtype=np.int64)
+    entries['archive_offset'] = (frame_offsets[number // segments_per_frame]
+                                 + (number % segments_per_frame) * segment_blocks * codec.nsize) if count else 0
+    entries['encoded_len'] = [_encoded_size(codec, int(size)) for size in entries['raw_len']]
+    _scan_rows(csv_path, entries, segment_raw)
+
+    leaves = []
+    with open(archive_path, 'rb') as src:
+        for i in range(count):
+            src.seek(int(entries['archive_offset'][i]))
+            encoded = _read_exact(src, int(entries['encoded_len'][i]))
+            leaves.append(_leaf_hash(entries[i:i + 1].tobytes(), encoded))
+    levels = _tree_levels(leaves)
+
+    table = _HEADER.pack(MAGIC, VERSION, codec.nsym, codec.nsize, segment_blocks, count) + entries.tobytes()
+    dst.write(table)
+    for level in levels:
+        dst.write(b''.join(level))
+    return _commit(table, levels[-1][0] if leaves else _empty_root()).hex()
+
+
+def _strip_parity(codec, encoded):
+    # Systematic code: the message is the start of every block
+    view = memoryview(encoded)
+    return b''.join(view[start:start + codec.nsize - codec.nsym]
+                    for start in range(0, len(encoded), codec.nsize))
+
+
+class BlockIndex(object):
+    """An open index file plus its archive, checked against a trusted published ``root``.
+
+    The header and entry table are verified on open.  Decoded segments are
+    cached until ``release`` drops them.
+    """
+
+    def __init__(self, index_file, archive_file, codec, root):
+        self.codec = codec
+        self._index = index_file
+        self._archive = archive_file
+        header = _read_exact(index_file, _HEADER.size)
+        magic, version, nsym, nsize, self.segment_blocks, count = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise BlockIndexError('Not a block index')
+        if version != VERSION:
+            raise BlockIndexError(f'Unsupported block index version {version}')
+        if (nsym, nsize) != (codec.nsym, codec.nsize):
+            raise BlockIndexError(f'Index was built for nsym={nsym}, nsize={nsize}')
+        table = _read_exact(index_file, ENTRY.itemsize * count)
+        self.entries = np.frombuffer(table, dtype=ENTRY)
+        self._levels = []
+        offset = _HEADER.size + ENTRY.itemsize * count
+        for size in _level_sizes(count):
+            self._levels.append((offset, size))
+            offset += HASH_SIZE * size
+
+        self._tree_root = self._node(len(self._levels) - 1, 0) if count else _empty_root()
+        if not hmac.compare_digest(_commit(header + table, self._tree_root), root):
+            raise BlockIndexError('Block index does not match the Merkle root')
+        self.segment_raw = self.segment_blocks * codec.k
+        self.raw_total = int(self.entries['raw_offset'][-1]) + int(self.entries['raw_len'][-1]) if count else 0
+        self.loaded = set()
+        self.repaired = set()
+        self._decoded = {}
+
+    def _node(self, level, position):
+        offset, _ = self._levels[level]
+        self._index.seek(offset + HASH_SIZE * position)
+        return _read_exact(self._index, HASH_SIZE)
+
+    def _verify(self, segment, encoded):
+        node = _leaf_hash(self.entries[segment:segment + 1].tobytes(), encoded)
+        position = segment
+        for level, (_, size) in enumerate(self._levels[:-1]):
+            sibling = position ^ 1
+            if sibling < size:
+                other = self._node(level, sibling)
+                node = _node_hash(node, other) if position % 2 == 0 else _node_hash(other, node)
+            position //= 2
+        return hmac.compare_digest(node, self._tree_root)
+
+    def _load(self, segment):
+        # Plaintext of one segment, verified against the tree and repaired if needed
+        entry = self.entries[segment]
+        self._archive.seek(int(entry['archive_offset']))
+        encoded = self._archive.read(int(entry['encoded_len']))
+        self.loaded.add(segment)
+        if self._verify(segment, encoded):
+            return _strip_parity(self.codec, encoded)
+        try:
+            decoded = bytes(self.codec.decode(encoded)[0])
+        except Exception:
+            raise BlockIndexError(f'Segment {segment} is damaged beyond repair')
+        if not self._verify(segment, bytes(self.codec.encode(decoded))):
+            raise BlockIndexError(f'Segment {segment} failed Merkle verification')
+        self.repaired.add(segment)
+        return decoded
+
+    def check(self, segments):
+        """Verify (and if needed repair) ``segments`` without keeping their plaintext."""
+        for segment in segments:
+            self._load(segment)
+
+    def segment(self, segment):
+        if segment not in self._decoded:
+            self._decoded[segment] = self._load(segment)
+        return self._decoded[segment]
+
+    def release(self, before):
+        """Drop cached segments numbered below ``before``."""
+        for segment in [segment for segment in self._decoded if segment < before]:
+            del self._decoded[segment]
+
+    def segments_for(self, start, end):
+        """Numbers of the segments holding plaintext bytes ``[start, end)``."""
+        if start >= end:
+            return range(0)
+        return range(start // self.segment_raw, (end - 1) // self.segment_raw + 1)
+
+    def read_bytes(self, start, end):
+        """Plaintext bytes ``[start, end)`` of the original file."""
+        segments = self.segments_for(start, end)
+        if not segments:
+            return b''
+        data = b''.join(self.segment(i) for i in segments)
+        offset = segments[0] * self.segment_raw
+        return data[start - offset:end - offset]
+
+    def row_span(self, segment):
+        """Byte range of the rows that start in ``segment``."""
+        following = segment + 1
+        end = int(self.entries['first_row'][following]) if following < len(self.entries) else self.raw_total
+        return int(self.entries['first_row'][segment]), end
+
+    def matching_segments(self, start_id, end_id):
+        """Segments with a row start whose ID range overlaps ``[start_id, end_id]``."""
+        entries = self.entries
+        start_id, end_id = max(start_id, MIN_ID), min(end_id, MAX_ID)
+        return np.flatnonzero((entries['min_id'] <= end_id) & (entries['max_id'] >= start_id))
+
+
+def _iter_range(index, header_bytes, column, spans, start_id, end_id, stats):
+    yield header_bytes
+    rows = 0
+    for start, end in spans:
+        data = index.read_bytes(start, end)
+        # The next span starts at or after ``end``, so earlier segments are done with
+        index.release(end // index.segment_raw)
+        matched = []
+        for row_start, row_end, row in _records(io.BytesIO(data)):
+            row_id = _parse_id(row[column]) if column < len(row) else None
+            if row_id is not None and start_id <= row_id <= end_id:
+                matched.append(data[row_start:row_end])
+        rows += len(matched)
+        if matched:
+            yield b''.join(matched)
+    if stats is not None:
+        stats['rows'] = rows
+
+
+def open_range(index_file, archive_file, codec, root, start_id, end_id, stats=None):
+    """Return a buffered binary file object with the CSV header plus the rows
+    with ``start_id <= Transaction ID <= end_id``.
+
+    The entry table and every segment those rows touch are verified against
+    the published ``root`` (bytes) before this returns, so a bad index or
+    archive fails here rather than halfway through a streamed response.  The
+    rows are then decoded one segment at a time.  ``stats``, if given,
+    receives the segment and repair counts on return and the row count once
+    the stream has been read.  Closing the result closes both files.
+    """
+    files = contextlib.ExitStack()
+    files.callback(archive_file.close)
+    files.callback(index_file.close)
+    try:
+        index = BlockIndex(index_file, archive_file, codec, root)
+        header_end = int(index.entries['first_row'][0]) if len(index.entries) else 0
+        spans = [index.row_span(segment) for segment in index.matching_segments(start_id, end_id)]
+        needed = set(index.segments_for(0, header_end))
+        for start, end in spans:
+            needed.update(index.segments_for(start, end))
+        index.check(sorted(needed))
+        if stats is not None:
+            stats.update(segments=len(index.loaded), repaired=len(index.repaired))
+
+        header_bytes = index.read_bytes(0, header_end)
+        index.release(header_end // index.segment_raw)
+        _, _, header = next(_records(io.BytesIO(header_bytes)), (0, 0, []))
+        column = _id_column(header) if header_bytes else 0
+    except Exception:
+        files.close()
+        raise
+    chunks = _iter_range(index, header_bytes, column, spans, start_id, end_id, stats)
+    return io.BufferedReader(archive._ChunkReader(chunks, files))
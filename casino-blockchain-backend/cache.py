@@ -0,0 +1,145 @@
+"""Content-addressed on-disk cache of processing results.
+
+Entries are keyed by the SHA-256 of the uploaded bytes plus every parameter
+that changes the output (codec, sharing, archive version...).  Each entry is
+a directory holding the result files and a ``meta.json``; it is built in a
+temporary directory and renamed into place, so readers never see a partial
+entry.  Total size is kept under ``max_bytes`` by evicting the least
+recently used entries.
+"""
+import collections
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+META_FILE = 'meta.json'
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ResultCache(object):
+    """Thread-safe LRU cache of result files; ``max_bytes <= 0`` disables it."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> entry size in bytes, least recently used first
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        if self.enabled:
+            os.makedirs(root, exist_ok=True)
+            self._load()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _load(self):
+        # Rebuild the LRU order from the entries' last-use times
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.') or not os.path.isfile(os.path.join(path, META_FILE)):
+                continue
+            found.append((os.path.getmtime(os.path.join(path, META_FILE)), name, _dir_size(path)))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._bytes += size
+
+    @staticmethod
+    def key(digest, **params):
+        """Combine an upload digest and the output-affecting parameters into a cache key."""
+        material = json.dumps({'sha256': digest, 'params': params}, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key, dest_dir):
+        """On a hit, link the entry's files into ``dest_dir`` and return its metadata."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = os.path.join(self.root, key)
+            try:
+                with open(os.path.join(path, META_FILE)) as f:
+                    meta = json.load(f)
+                for name in meta['files']:
+                    _link_or_copy(os.path.join(path, name), os.path.join(dest_dir, name))
+                os.utime(os.path.join(path, META_FILE))
+            except (OSError, ValueError, KeyError):
+                # Removed or damaged on disk (by hand, or by another process sharing
+                # the root): forget it so the caller rebuilds the entry
+                self._bytes -= self._entries.pop(key)
+                shutil.rmtree(path, ignore_errors=True)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return meta
+
+    def put(self, key, files, meta):
+        """Store ``files`` (name -> path) with ``meta`` under ``key`` and evict to fit."""
+        if not self.enabled:
+            return
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        try:
+            for name, src in files.items():
+                _link_or_copy(src, os.path.join(staging, name))
+            with open(os.path.join(staging, META_FILE), 'w') as f:
+                json.dump(dict(meta, files=sorted(files)), f)
+            size = _dir_size(staging)
+            if size > self.max_bytes:
+                return
+
+            with self._lock:
+                if key in self._entries:
+                    return
+                path = os.path.join(self.root, key)
+                try:
+                    os.rename(staging, path)
+                except OSError:
+                    # Another process sharing the root stored the same entry first;
+                    # adopt it (get() drops it again if it turns out to be damaged)
+                    if not os.path.isdir(path):
+                        raise
+                self._entries[key] = size
+                self._bytes += size
+                self._evict()
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
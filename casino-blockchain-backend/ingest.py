@@ -0,0 +1,263 @@
+"""Schema validation and typed, chunked ingest of transaction CSVs.
+
+``read_header`` checks the column names from the first line only, so bad
+uploads are rejected before any heavy work.  ``scan`` then streams the body
+in chunks with an explicit dtype schema, counting rows and collecting
+per-column statistics in one pass, and can optionally write a compact
+columnar copy (``.npz`` with NumPy, or ``.parquet`` when pyarrow is installed).
+"""
+import csv
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = None
+    pq = None
+
+REQUIRED_COLUMNS = ['Transaction ID', 'User ID', 'Amount', 'Date', 'Type', 'Game ID', 'Currency', 'Status', 'Payment Method', 'Notes']
+
+INTEGER_COLUMNS = ['Transaction ID', 'User ID', 'Game ID']
+NUMERIC_COLUMNS = INTEGER_COLUMNS + ['Amount']
+CATEGORY_COLUMNS = ['Type', 'Currency', 'Status', 'Payment Method']
+DATE_COLUMN = 'Date'
+DATE_FORMAT = '%m/%d/%Y'
+
+# Nullable integers so a blank cell does not abort the whole file
+DTYPES = {
+    'Transaction ID': 'Int64',
+    'User ID': 'Int64',
+    'Amount': 'float64',
+    'Date': 'string',
+    'Type': 'category',
+    'Game ID': 'Int64',
+    'Currency': 'category',
+    'Status': 'category',
+    'Payment Method': 'category',
+    'Notes': 'string',
+}
+
+DEFAULT_CHUNKSIZE = 100000
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def read_header(path):
+    """Return the column names from the first line of ``path``.
+
+    Raises ``SchemaError`` if the file is empty or lacks a required column.
+    """
+    try:
+        # utf-8-sig drops the byte order mark that Excel puts before the first column name
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), None)
+    except UnicodeDecodeError:
+        header = None
+    if not header:
+        raise SchemaError('CSV file is empty or invalid')
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise SchemaError('CSV file is missing required columns')
+    return header
+
+
+def _new_stats():
+    return {
+        'rows': 0,
+        'nulls': {column: 0 for column in REQUIRED_COLUMNS},
+        'numeric': {column: {'min': None, 'max': None, 'sum': 0} for column in NUMERIC_COLUMNS},
+        'categories': {column: {} for column in CATEGORY_COLUMNS},
+        'date': {'min': None, 'max': None},
+    }
+
+
+def _merge_extreme(current, value, pick):
+    if value is None or pd.isna(value):
+        return current
+    return value if current is None else pick(current, value)
+
+
+def _update_stats(stats, chunk):
+    stats['rows'] += len(chunk)
+    for column, count in chunk.isna().sum().items():
+        stats['nulls'][column] += int(count)
+
+    for column in NUMERIC_COLUMNS:
+        values = chunk[column]
+        entry = stats['numeric'][column]
+        entry['min'] = _merge_extreme(entry['min'], values.min(), min)
+        entry['max'] = _merge_extreme(entry['max'], values.max(), max)
+        entry['sum'] += values.sum()
+
+    for column in CATEGORY_COLUMNS:
+        counts = stats['categories'][column]
+        for value, count in chunk[column].value_counts().items():
+            counts[value] = counts.get(value, 0) + int(count)
+
+    dates = chunk[DATE_COLUMN]
+    stats['date']['min'] = _merge_extreme(stats['date']['min'], dates.min(), min)
+    stats['date']['max'] = _merge_extreme(stats['date']['max'], dates.max(), max)
+
+
+def _finish_stats(stats):
+    # Convert NumPy/pandas scalars so the stats can be returned as JSON
+    for entry in stats['numeric'].values():
+        for key, value in entry.items():
+            if value is not None:
+                entry[key] = value.item() if hasattr(value, 'item') else value
+    for key, value in stats['date'].items():
+        if value is not None:
+            stats['date'][key] = value.strftime('%Y-%m-%d')
+    return stats
+
+
+class _NpzWriter(object):
+    """Writes typed chunks to one ``.npz`` with the layout of ``np.savez_compressed``.
+
+    Each chunk's arrays are spilled to a scratch directory as they arrive and
+    copied into the archive one chunk at a time by ``close``, so memory is
+    bounded by the chunk size rather than the file size.  Categorical columns
+    are stored as ``<column>.codes`` plus ``<column>.categories``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._scratch = tempfile.mkdtemp(prefix='.npz-', dir=os.path.dirname(os.path.abspath(path)))
+        self._chunks = 0
+        self._rows = 0
+        # Array name -> dtype wide enough for every chunk seen so far
+        self._dtypes = {}
+        # Category column -> {value: code}, codes in order of first appearance
+        self._categories = {column: {} for column in CATEGORY_COLUMNS}
+
+    def _spill(self, name, values):
+        np.save(os.path.join(self._scratch, f'{self._chunks}-{name}.npy'), values)
+        dtype = self._dtypes.get(name)
+        self._dtypes[name] = values.dtype if dtype is None else np.promote_types(dtype, values.dtype)
+
+    def write(self, chunk):
+        for column in REQUIRED_COLUMNS:
+            values = chunk[column]
+            if column in CATEGORY_COLUMNS:
+                # Translate this chunk's codes to codes shared by the whole file; -1 stays missing
+                seen = self._categories[column]
+                lookup = [seen.setdefault(str(value), len(seen)) for value in values.cat.categories]
+                self._spill(f'{column}.codes', np.array(lookup + [-1], dtype='int32')[values.cat.codes.to_numpy()])
+            elif column in INTEGER_COLUMNS:
+                self._spill(column, values.to_numpy(dtype='int64', na_value=0))
+                self._spill(f'{column}.mask', values.isna().to_numpy())
+            elif column == DATE_COLUMN:
+                self._spill(column, values.to_numpy(dtype='datetime64[D]'))
+            elif column == 'Notes':
+                self._spill(column, values.to_numpy(dtype=str, na_value=''))
+            else:
+                self._spill(column, values.to_numpy())
+        self._chunks += 1
+        self._rows += len(chunk)
+
+    def _copy(self, npz, name, remap=None):
+        dtype = self._dtypes[name]
+        with npz.open(f'{name}.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array_header_1_0(
+                f, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (self._rows,)})
+            for index in range(self._chunks):
+                values = np.load(os.path.join(self._scratch, f'{index}-{name}.npy'))
+                if remap is not None:
+                    values = remap[values]
+                f.write(values.astype(dtype, copy=False).tobytes())
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as npz:
+                for column, seen in self._categories.items():
+                    # Sorted categories, as a single astype('category') over the whole column gives
+                    categories = sorted(seen)
+                    remap = np.full(len(seen) + 1, -1, dtype='int32')
+                    remap[[seen[value] for value in categories]] = np.arange(len(categories))
+                    # Narrowest signed type that holds every code, as pandas picks
+                    self._dtypes[f'{column}.codes'] = np.result_type(np.int8, np.min_scalar_type(-len(categories) - 1))
+                    self._copy(npz, f'{column}.codes', remap)
+                    with npz.open(f'{column}.categories.npy', 'w') as f:
+                        np.lib.format.write_array(f, np.array(categories, dtype=str))
+                for name in self._dtypes:
+                    if not name.endswith('.codes'):
+                        self._copy(npz, name)
+        finally:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+
+
+class _ParquetWriter(object):
+    def __init__(self, path):
+        if pa is None:
+            raise SchemaError('Parquet output requires pyarrow')
+        fields = []
+        for column in REQUIRED_COLUMNS:
+            if column in INTEGER_COLUMNS:
+                fields.append(pa.field(column, pa.int64()))
+            elif column in CATEGORY_COLUMNS:
+                fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+            elif column == DATE_COLUMN:
+                fields.append(pa.field(column, pa.timestamp('ns')))
+            elif column == 'Amount':
+                fields.append(pa.field(column, pa.float64()))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, chunk):
+        table = pa.Table.from_pandas(chunk[REQUIRED_COLUMNS], schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+
+
+def _columnar_writer(path):
+    if path.endswith('.parquet'):
+        return _ParquetWriter(path)
+    if path.endswith('.npz'):
+        return _NpzWriter(path)
+    raise SchemaError(f'Unsupported columnar format: {path}')
+
+
+def iter_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield typed DataFrame chunks of the required columns of ``path``."""
+    reader = pd.read_csv(path, usecols=REQUIRED_COLUMNS, dtype=DTYPES, chunksize=chunksize)
+    try:
+        for chunk in reader:
+            chunk[DATE_COLUMN] = pd.to_datetime(chunk[DATE_COLUMN], format=DATE_FORMAT, errors='coerce')
+            yield chunk
+    except (ValueError, TypeError, OverflowError) as e:
+        # e.g. "1.5" or a 20-digit number in an integer ID column
+        raise SchemaError(f'CSV file has invalid values: {e}')
+    finally:
+        reader.close()
+
+
+def scan(path, chunksize=DEFAULT_CHUNKSIZE, columnar_path=None):
+    """Stream ``path`` once, returning row count and per-column statistics.
+
+    Dates that do not match ``DATE_FORMAT`` are counted as nulls.  If
+    ``columnar_path`` ends in ``.npz`` or ``.parquet`` a typed columnar copy
+    is written there as well.
+    """
+    read_header(path)  # cheap, and fails before any parsing work
+    writer = _columnar_writer(columnar_path) if columnar_path else None
+    stats = _new_stats()
+    for chunk in iter_chunks(path, chunksize):
+        _update_stats(stats, chunk)
+        if writer is not None:
+            writer.write(chunk)
+    if writer is not None:
+        writer.close()
+    return _finish_stats(stats)
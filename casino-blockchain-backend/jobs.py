@@ -0,0 +1,120 @@
+"""Background job queue with an isolated temporary workspace per job.
+
+A job is reserved first (which is where backpressure applies), the request
+handler saves its upload into ``job.workspace``, and the job is then started
+on a bounded thread pool.  Finished jobs keep their workspace, and so their
+result files, for ``ttl`` seconds before a sweep removes them.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job(object):
+    def __init__(self, kind, workspace):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.workspace = workspace
+        self.status = QUEUED
+        self.error = None
+        # Name -> (path, download name) of the files a finished job produced
+        self.artifacts = {}
+        # Name -> (bytes, download name) of in-memory outputs removed by their first download
+        self.one_shot = {}
+        self.result = {}
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'result': self.result,
+            'artifacts': sorted(list(self.artifacts) + list(self.one_shot)),
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager(object):
+    """Runs jobs on ``workers`` threads with at most ``max_pending`` queued or running."""
+
+    def __init__(self, root, workers=2, max_pending=16, ttl=3600):
+        self.root = root
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def reserve(self, kind):
+        """Create a queued job and its workspace, or raise ``JobQueueFull``."""
+        self.sweep()
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f'{pending} jobs already pending')
+            job = Job(kind, tempfile.mkdtemp(prefix=f'{kind}-', dir=self.root))
+            self._jobs[job.id] = job
+        return job
+
+    def start(self, job, fn):
+        """Run ``fn(job)`` in the background; it may fill ``job.result`` and ``job.artifacts``."""
+        self._executor.submit(self._run, job, fn)
+
+    def discard(self, job):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        shutil.rmtree(job.workspace, ignore_errors=True)
+
+    def get(self, job_id):
+        self.sweep()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def sweep(self):
+        """Remove jobs, and their workspaces, that finished more than ``ttl`` seconds ago."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished and job.finished_at < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.workspace, ignore_errors=True)
+
+    def _run(self, job, fn):
+        job.status = RUNNING
+        status = FAILED
+        try:
+            fn(job)
+            status = DONE
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+        finally:
+            # finished_at must be set before the status marks the job as finished
+            job.finished_at = time.time()
+            job.status = status
+
+    def shutdown(self):
+        self._executor.shutdown()
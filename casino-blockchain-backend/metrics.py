@@ -0,0 +1,158 @@
+"""Per-stage timing with Server-Timing headers and Prometheus-format export.
+
+Handlers start a ``Timer`` per request (or job); code anywhere below it wraps
+work in ``with metrics.stage('encode') as counts:`` and may fill
+``counts['bytes']`` / ``counts['rows']``.  Finished stages are folded into
+process-wide histograms that ``render_prometheus`` serves as text.
+"""
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage duration buckets in seconds (+Inf is implicit)
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_local = threading.local()
+
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    """Thread-safe store of stage histograms and byte/row counters, keyed by (endpoint, stage)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._bytes = {}
+        self._rows = {}
+        self._collectors = []
+
+    def record(self, endpoint, stage, seconds, bytes=None, rows=None):
+        key = (endpoint, stage)
+        with self._lock:
+            self._durations.setdefault(key, Histogram()).observe(seconds)
+            if bytes is not None:
+                self._bytes[key] = self._bytes.get(key, 0) + bytes
+            if rows is not None:
+                self._rows[key] = self._rows.get(key, 0) + rows
+
+    def add_collector(self, name, help_text, kind, fn):
+        """Export ``fn()`` (a number) as metric ``name`` on every scrape."""
+        self._collectors.append((name, help_text, kind, fn))
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            durations = {key: (list(h.counts), h.sum, h.count) for key, h in self._durations.items()}
+            byte_totals = dict(self._bytes)
+            row_totals = dict(self._rows)
+
+        lines.append('# HELP casino_stage_duration_seconds Time spent in each request stage.')
+        lines.append('# TYPE casino_stage_duration_seconds histogram')
+        for (endpoint, stage), (counts, total, count) in sorted(durations.items()):
+            labels = f'endpoint="{_escape(endpoint)}",stage="{_escape(stage)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'casino_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'casino_stage_duration_seconds_sum{{{labels}}} {total}')
+            lines.append(f'casino_stage_duration_seconds_count{{{labels}}} {count}')
+
+        for name, help_text, totals in (
+                ('casino_stage_bytes_total', 'Bytes processed by each request stage.', byte_totals),
+                ('casino_stage_rows_total', 'CSV rows processed by each request stage.', row_totals)):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (endpoint, stage), value in sorted(totals.items()):
+                lines.append(f'{name}{{endpoint="{_escape(endpoint)}",stage="{_escape(stage)}"}} {value}')
+
+        for name, help_text, kind, fn in self._collectors:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {fn()}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Timer(object):
+    """Stages recorded for one request or job, in the order they finished."""
+
+    def __init__(self, endpoint, registry):
+        self.endpoint = endpoint
+        self.registry = registry
+        self.stages = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        counts = {}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.record(name, time.perf_counter() - start, **counts)
+
+    def record(self, name, seconds, bytes=None, rows=None):
+        self.stages.append((name, seconds))
+        self.registry.record(self.endpoint, name, seconds, bytes=bytes, rows=rows)
+
+    def server_timing(self):
+        """Value for the ``Server-Timing`` header, durations in milliseconds."""
+        entries = [f'{_token(name)};dur={seconds * 1000:.1f}' for name, seconds in self.stages]
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def _token(name):
+    # Server-Timing metric names must be HTTP tokens
+    return re.sub(r'[^A-Za-z0-9!#$%&\'*+.^_`|~-]', '_', name)
+
+
+registry = Registry()
+
+
+def start(endpoint):
+    """Begin timing ``endpoint`` on the current thread and return its ``Timer``."""
+    timer = Timer(endpoint, registry)
+    _local.timer = timer
+    return timer
+
+
+def current():
+    return getattr(_local, 'timer', None)
+
+
+def finish():
+    """Detach and return the current thread's ``Timer``, recording its total duration."""
+    timer = current()
+    _local.timer = None
+    if timer is not None:
+        registry.record(timer.endpoint, 'total', time.perf_counter() - timer.started)
+    return timer
+
+
+@contextmanager
+def stage(name):
+    """Time a stage on the current thread's ``Timer``; a no-op outside of one."""
+    timer = current()
+    if timer is None:
+        yield {}
+        return
+    with timer.stage(name) as counts:
+        yield counts
@@ -0,0 +1,87 @@
+"""Process pool that encodes and decodes archive frames on several cores.
+
+Frames are independent ranges of RS blocks, so each one is handed to a worker
+process as a separate task and the results are yielded back in submission
+order.  Only ``max_pending`` frames are in flight at any time, which keeps
+memory bounded while the input is streamed.
+
+Workers are started with the ``spawn`` method: the server forks from a
+process that already runs job and profiler threads, and a forked child can
+inherit a lock one of them was holding.
+"""
+import collections
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from archive import decode_frame, encode_frame
+from rs_engine import NumpyRSCodec
+
+# Codec owned by each worker process, built once by the pool initializer
+_worker_codec = None
+
+
+def _init_worker(nsym, nsize):
+    global _worker_codec
+    _worker_codec = NumpyRSCodec(nsym, nsize)
+
+
+def _encode_task(raw):
+    return encode_frame(_worker_codec, raw)
+
+
+def _decode_task(args):
+    return decode_frame(_worker_codec, *args)
+
+
+class FramePool(object):
+    """Order-preserving frame encoder/decoder.
+
+    With ``workers <= 1`` everything runs in the calling process; otherwise the
+    process pool is started lazily on first use.
+    """
+
+    def __init__(self, codec, workers=1, max_pending=None):
+        self.codec = codec
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Concurrent requests may both find no pool; only one of them creates it
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self.codec.nsym, self.codec.nsize))
+            return self._executor
+
+    def _map(self, task, local, items):
+        if self.workers == 1:
+            for item in items:
+                yield local(item)
+            return
+
+        pool = self._pool()
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.submit(task, item))
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def encode(self, raws):
+        """Yield ``archive.encode_frame`` results for each raw frame in ``raws``."""
+        return self._map(_encode_task, lambda raw: encode_frame(self.codec, raw), raws)
+
+    def decode(self, frames):
+        """Yield decoded bytes for each tuple of ``archive.decode_frame`` arguments in ``frames``."""
+        return self._map(_decode_task, lambda frame: decode_frame(self.codec, *frame), frames)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
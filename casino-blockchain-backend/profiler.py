@@ -0,0 +1,74 @@
+"""Opt-in sampling profiler for individual requests.
+
+A background thread snapshots the target thread's stack every ``interval``
+seconds and counts identical stacks.  ``collapsed()`` returns them in the
+"collapsed stack" format that flamegraph.pl and speedscope read.  Only the
+request thread is sampled; work done in the frame pool's worker processes
+shows up as time spent waiting on their results.
+"""
+import collections
+import sys
+import threading
+import time
+import uuid
+
+DEFAULT_INTERVAL = 0.005
+
+
+class SamplingProfiler(object):
+    def __init__(self, interval=DEFAULT_INTERVAL, thread_id=None):
+        self.id = uuid.uuid4().hex
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = collections.Counter()
+        self.duration = 0.0
+        self._started = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f'profiler-{self.id[:8]}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+class ProfileStore(object):
+    """Keeps the most recent ``limit`` finished profiles by id."""
+
+    def __init__(self, limit=20):
+        self._profiles = collections.OrderedDict()
+        self._limit = limit
+        self._lock = threading.Lock()
+
+    def add(self, profiler):
+        with self._lock:
+            self._profiles[profiler.id] = profiler
+            while len(self._profiles) > self._limit:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
@@ -0,0 +1,270 @@
+import numpy as np
+import reedsolo
+
+# Modulus of the per-block position-weighted checksum (largest prime below 2^16)
+CHECKSUM_MOD = 65521
+
+
+class NumpyRSCodec(object):
+    """Drop-in replacement for ``reedsolo.RSCodec`` that works on all blocks at once.
+
+    Encoding, syndrome calculation and clean-block checking are done as batched
+    table lookups over a 2-D ``blocks x nsize`` array.  Only blocks whose
+    syndromes are non-zero are handed to reedsolo's per-block corrector, so the
+    output stays byte-for-byte identical to ``RSCodec(nsym, nsize)``.
+    """
+
+    def __init__(self, nsym=10, nsize=255, batch_blocks=4096):
+        if nsize > 255:
+            raise ValueError('NumpyRSCodec only supports GF(2^8) (nsize <= 255)')
+
+        # The reference codec supplies the field tables and generator polynomial,
+        # and repairs the blocks that actually contain errors.
+        self._codec = reedsolo.RSCodec(nsym, nsize)
+        self.nsym = nsym
+        self.nsize = nsize
+        self.fcr = self._codec.fcr
+        self.generator = self._codec.generator
+        self.batch_blocks = batch_blocks
+
+        gf_log = np.array(self._codec.gf_log, dtype=np.int64)
+        gf_exp = np.array(self._codec.gf_exp, dtype=np.uint8)
+        self._gf_exp = gf_exp
+
+        # Full 256x256 multiplication table
+        mul = gf_exp[gf_log[:, None] + gf_log[None, :]]
+        mul[0, :] = 0
+        mul[:, 0] = 0
+        self._mul = mul
+        self._gen = np.array(self._codec.gen[nsym][1:], dtype=np.uint8)
+
+        # Pad each nsym-byte row to a whole number of 64-bit words so the XOR
+        # reductions run on uint64 lanes instead of single bytes.
+        self._width = -(-nsym // 8) * 8
+
+        k = nsize - nsym
+        unit_parity = self._lfsr_parity(np.eye(k, dtype=np.uint8))
+        self._parity_table = self._pack(mul[np.arange(256)[None, :, None], unit_parity[:, None, :]])
+
+        degrees = np.arange(nsize - 1, -1, -1)
+        roots = np.arange(nsym) + self.fcr
+        log_points = (roots[None, :] * degrees[:, None] * gf_log[self.generator]) % 255
+        points = gf_exp[log_points]
+        self._syndrome_table = self._pack(mul[np.arange(256)[None, :, None], points[:, None, :]])
+
+    @property
+    def k(self):
+        return self.nsize - self.nsym
+
+    def _pack(self, table):
+        # (..., nsym) uint8 -> (..., width // 8) uint64
+        padded = np.zeros(table.shape[:-1] + (self._width,), dtype=np.uint8)
+        padded[..., :self.nsym] = table
+        return padded.view(np.uint64)
+
+    def _unpack(self, words):
+        return words.view(np.uint8).reshape(words.shape[0], self._width)[:, :self.nsym]
+
+    def _lfsr_parity(self, msgs):
+        # Same synthetic division as reedsolo.rs_encode_msg, run over every row at once
+        rem = np.zeros((msgs.shape[0], self.nsym), dtype=np.uint8)
+        for i in range(msgs.shape[1]):
+            feedback = msgs[:, i] ^ rem[:, 0]
+            rem[:, :-1] = rem[:, 1:]
+            rem[:, -1] = 0
+            rem ^= self._mul[feedback[:, None], self._gen[None, :]]
+        return rem
+
+    def _reduce(self, table, blocks):
+        # XOR together one table row per (position, byte) pair, batch by batch.
+        # Flattening to (positions * 256) rows lets np.take do a single gather.
+        flat = table.reshape(-1, table.shape[-1])
+        offsets = np.arange(blocks.shape[1], dtype=np.intp) * 256
+        out = np.empty((blocks.shape[0], table.shape[-1]), dtype=np.uint64)
+        for start in range(0, blocks.shape[0], self.batch_blocks):
+            batch = blocks[start:start + self.batch_blocks]
+            rows = np.take(flat, batch + offsets, axis=0)
+            out[start:start + len(batch)] = np.bitwise_xor.reduce(rows, axis=1)
+        return out
+
+    def _as_blocks(self, data, size):
+        """Split ``data`` into full rows of ``size`` bytes plus a left zero-padded tail row.
+
+        Leading zeros do not change an RS codeword, so a short tail can share the
+        same position tables as the full blocks.
+        """
+        buf = np.frombuffer(bytes(data), dtype=np.uint8)
+        full = len(buf) // size
+        tail_len = len(buf) - full * size
+        rows = full + (1 if tail_len else 0)
+        blocks = np.zeros((rows, size), dtype=np.uint8)
+        blocks[:full] = buf[:full * size].reshape(full, size)
+        if tail_len:
+            blocks[full, size - tail_len:] = buf[full * size:]
+        return blocks, tail_len
+
+    def parity(self, blocks):
+        """ECC symbols for a ``blocks x k`` array of (left zero-padded) messages."""
+        return self._unpack(self._reduce(self._parity_table, blocks))
+
+    def syndromes(self, blocks):
+        """Syndromes (without reedsolo's leading 0) for a ``blocks x nsize`` array."""
+        return self._unpack(self._reduce(self._syndrome_table, blocks))
+
+    def clean_mask(self, blocks):
+        """Boolean mask of the rows in a ``blocks x nsize`` array that have no errors."""
+        return ~self._reduce(self._syndrome_table, blocks).any(axis=1)
+
+    def block_checksums(self, data):
+        """Position-weighted checksum of each ``nsize`` codeword in ``data``.
+
+        Each value packs ``sum(c) % M`` in the high 16 bits and
+        ``sum((i + 1) * c) % M`` in the low 16 bits, with ``i`` the position in
+        the left zero-padded block.  A matching checksum marks a block clean
+        without computing syndromes, and a single corrupted byte can be located
+        from the two differences (see ``_locate_single_error``).
+        """
+        blocks, _ = self._as_blocks(data, self.nsize)
+        return self._checksums(blocks)
+
+    def _checksums(self, blocks):
+        weights = np.arange(1, self.nsize + 1, dtype=np.int64)
+        plain = blocks.sum(axis=1, dtype=np.int64) % CHECKSUM_MOD
+        weighted = (blocks.astype(np.int64) @ weights) % CHECKSUM_MOD
+        return ((plain << 16) | weighted).astype(np.uint32)
+
+    def _locate_single_error(self, actual, expected):
+        # If exactly one byte changed by e at padded position p, the sums differ
+        # by e and (p + 1) * e, so p + 1 is their ratio mod M.
+        d_plain = ((int(actual) >> 16) - (int(expected) >> 16)) % CHECKSUM_MOD
+        d_weighted = ((int(actual) & 0xFFFF) - (int(expected) & 0xFFFF)) % CHECKSUM_MOD
+        if d_plain == 0:
+            return None
+        position = d_weighted * pow(d_plain, CHECKSUM_MOD - 2, CHECKSUM_MOD) % CHECKSUM_MOD - 1
+        return position if 0 <= position < self.nsize else None
+
+    def encode(self, data, nsym=None):
+        if nsym and nsym != self.nsym:
+            return self._codec.encode(data, nsym)
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+
+        k = self.k
+        blocks, tail_len = self._as_blocks(data, k)
+        codewords = np.empty((len(blocks), self.nsize), dtype=np.uint8)
+        codewords[:, :k] = blocks
+        codewords[:, k:] = self.parity(blocks)
+
+        encoded = codewords.reshape(-1)
+        if tail_len:
+            # Drop the zero padding in front of the short tail block
+            cut = (len(blocks) - 1) * self.nsize
+            encoded = np.concatenate([encoded[:cut], encoded[cut + k - tail_len:]])
+        return bytearray(encoded.tobytes())
+
+    def check(self, data, nsym=None):
+        if nsym and nsym != self.nsym:
+            return self._codec.check(data, nsym)
+        blocks, _ = self._as_blocks(data, self.nsize)
+        return self.clean_mask(blocks).tolist()
+
+    def decode(self, data, nsym=None, erase_pos=None, only_erasures=False, checksums=None):
+        """Same contract as ``RSCodec.decode``.
+
+        ``checksums`` are optional ``block_checksums`` taken at encode time.
+        Blocks whose checksum still matches skip the syndrome pass, and blocks
+        with one corrupted byte are repaired together as located erasures
+        instead of running Berlekamp-Massey and the Chien search per block.
+        """
+        if nsym and nsym != self.nsym:
+            return self._codec.decode(data, nsym, erase_pos=erase_pos, only_erasures=only_erasures)
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+
+        nsize = self.nsize
+        blocks, tail_len = self._as_blocks(data, nsize)
+        lengths = np.full(len(blocks), nsize)
+        if tail_len:
+            lengths[-1] = tail_len
+
+        # Group the known erasures by block, as RSCodec.decode does
+        erasures = {}
+        for pos in erase_pos or []:
+            erasures.setdefault(pos // nsize, []).append(pos % nsize)
+
+        repaired = {}
+        if checksums is not None and len(checksums) == len(blocks):
+            actual = self._checksums(blocks)
+            clean = actual == checksums
+            # A mismatch may just be a damaged checksum, so confirm with syndromes
+            suspect = np.flatnonzero(~clean)
+            clean[suspect] = self.clean_mask(blocks[suspect])
+            located = [(i, self._locate_single_error(actual[i], checksums[i]))
+                       for i in np.flatnonzero(~clean) if i not in erasures]
+            repaired = self._repair_located(blocks, lengths, located)
+        else:
+            clean = self.clean_mask(blocks)
+        clean[[i for i in erasures if i < len(blocks)]] = False
+        if tail_len and tail_len <= self.nsym:
+            clean[-1] = False
+
+        dec = bytearray()
+        dec_full = bytearray()
+        errata_pos_all = bytearray()
+        start = 0
+        for stop in list(np.flatnonzero(~clean)) + [len(blocks)]:
+            # Copy each run of clean blocks in one go
+            if stop > start:
+                self._append_clean(dec, dec_full, blocks[start:stop], tail_len if stop == len(blocks) else 0)
+            if stop == len(blocks):
+                break
+
+            chunk = blocks[stop, nsize - lengths[stop]:].tobytes()
+            if stop in repaired:
+                rmes, rmesecc, errata_pos = chunk[:-self.nsym], chunk, [repaired[stop]]
+            else:
+                rmes, rmesecc, errata_pos = self._codec.decode(
+                    chunk, erase_pos=erasures.get(stop), only_erasures=only_erasures)
+            dec.extend(rmes)
+            dec_full.extend(rmesecc)
+            errata_pos_all.extend(errata_pos)
+            start = stop + 1
+        return dec, dec_full, errata_pos_all
+
+    def _repair_located(self, blocks, lengths, located):
+        """Correct blocks in place whose single bad byte was located by checksum.
+
+        For one erasure at degree ``d`` the syndromes are ``S_j = e * X^(j + fcr)``
+        with ``X = generator^d``, so ``e`` follows from ``S_0`` alone; this is the
+        only-erasures decode, done for every located block at once.  Blocks that
+        still have non-zero syndromes afterwards are left for the full decoder.
+        Returns ``{block index: position in chunk}`` for the repaired blocks.
+        """
+        pads = self.nsize - lengths
+        located = [(i, p) for i, p in located if p is not None and p >= pads[i]]
+        if not located:
+            return {}
+        index = np.array([i for i, _ in located])
+        position = np.array([p for _, p in located])
+
+        gf_log = np.array(self._codec.gf_log, dtype=np.int64)
+        first = self.syndromes(blocks[index])[:, 0].astype(np.int64)
+        degree = self.nsize - 1 - position
+        log_error = (gf_log[first] - self.fcr * degree * gf_log[self.generator]) % 255
+        error = np.where(first != 0, self._gf_exp[log_error], 0).astype(np.uint8)
+
+        candidate = blocks[index]
+        candidate[np.arange(len(index)), position] ^= error
+        ok = (error != 0) & self.clean_mask(candidate)
+        blocks[index[ok]] = candidate[ok]
+        return {int(i): int(p - pads[i]) for i, p in zip(index[ok], position[ok])}
+
+    def _append_clean(self, dec, dec_full, blocks, tail_len):
+        # ``blocks`` is a run of clean codewords; the last row is the padded tail if tail_len
+        body = blocks[:-1] if tail_len else blocks
+        dec.extend(body[:, :self.k].tobytes())
+        dec_full.extend(body.tobytes())
+        if tail_len:
+            tail = blocks[-1, self.nsize - tail_len:]
+            dec.extend(tail[:-self.nsym].tobytes())
+            dec_full.extend(tail.tobytes())
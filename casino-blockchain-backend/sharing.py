@@ -0,0 +1,108 @@
+"""In-process Shamir secret sharing of per-upload encryption keys.
+
+Replaces the ``stego encrypt`` subprocess: each upload is encrypted with a
+fresh AES-256-GCM key, and the key is split into ``parts`` shares with a
+recovery ``threshold`` using pyseltongue.  Any ``threshold`` shares rebuild
+the key with ``recover_key`` and decrypt the file with ``decrypt_file``.
+
+Encrypted files are ``nonce (12 bytes) | ciphertext | GCM tag (16 bytes)``
+and are processed in chunks, so memory use does not grow with file size.
+"""
+import hashlib
+import os
+import secrets
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from pyseltongue import SecretSharer
+
+DEFAULT_PARTS = 5
+DEFAULT_THRESHOLD = 3
+KEY_BYTES = 32
+NONCE_BYTES = 12
+TAG_BYTES = 16
+CHUNK_SIZE = 1024 * 1024
+
+
+class DecryptionError(ValueError):
+    pass
+
+
+def generate_key():
+    """Return a fresh random key as a lowercase hex string."""
+    return secrets.token_hex(KEY_BYTES)
+
+
+def split_key(key, parts=DEFAULT_PARTS, threshold=DEFAULT_THRESHOLD):
+    """Split a hex ``key`` into ``parts`` shares, any ``threshold`` of which recover it."""
+    if not 2 <= threshold <= parts:
+        raise ValueError(f'Threshold must be between 2 and parts ({parts}), got {threshold}')
+    return SecretSharer.split_secret(key, threshold, parts)
+
+
+def recover_key(shares):
+    """Recombine at least ``threshold`` shares from ``split_key`` into the original key."""
+    try:
+        return SecretSharer.recover_secret(list(shares))
+    except (ValueError, IndexError):
+        raise DecryptionError('Invalid key shares')
+
+
+def hash_shares(shares):
+    return [hashlib.sha256(share.encode('ascii')).hexdigest() for share in shares]
+
+
+def create_shares(parts=DEFAULT_PARTS, threshold=DEFAULT_THRESHOLD):
+    """Generate a key and split it; returns ``(key, shares, share_hashes)``."""
+    key = generate_key()
+    shares = split_key(key, parts, threshold)
+    return key, shares, hash_shares(shares)
+
+
+def encrypt_file(key, src_path, dst_path):
+    """Encrypt ``src_path`` into ``dst_path`` with the hex ``key``; returns bytes written."""
+    nonce = os.urandom(NONCE_BYTES)
+    encryptor = Cipher(algorithms.AES(bytes.fromhex(key)), modes.GCM(nonce)).encryptor()
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        dst.write(nonce)
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            dst.write(encryptor.update(chunk))
+        dst.write(encryptor.finalize())
+        dst.write(encryptor.tag)
+        return dst.tell()
+
+
+def decrypt_file(key, src_path, dst_path):
+    """Decrypt a file written by ``encrypt_file``.
+
+    Raises ``DecryptionError`` if the key is wrong or the file was altered;
+    ``dst_path`` must then be discarded.
+    """
+    size = os.path.getsize(src_path)
+    if size < NONCE_BYTES + TAG_BYTES:
+        raise DecryptionError('Encrypted file is truncated')
+    try:
+        key_bytes = bytes.fromhex(key)
+    except ValueError:
+        raise DecryptionError('Key shares do not form a valid key')
+    if len(key_bytes) != KEY_BYTES:
+        raise DecryptionError('Key shares do not form a valid key')
+
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        nonce = src.read(NONCE_BYTES)
+        src.seek(size - TAG_BYTES)
+        tag = src.read(TAG_BYTES)
+        src.seek(NONCE_BYTES)
+        decryptor = Cipher(algorithms.AES(key_bytes), modes.GCM(nonce, tag)).decryptor()
+        remaining = size - NONCE_BYTES - TAG_BYTES
+        while remaining:
+            chunk = src.read(min(CHUNK_SIZE, remaining))
+            remaining -= len(chunk)
+            dst.write(decryptor.update(chunk))
+        try:
+            decryptor.finalize()
+        except InvalidTag:
+            raise DecryptionError('Key shares do not match the encrypted file')
@@ -1,10 +1,12 @@
-import csv
-import random
-from datetime import datetime, timedelta
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
 
 # Define the headers for the CSV
 headers = [
-    "Transaction ID", "User ID", "Amount", "Date", "Type", 
+    "Transaction ID", "User ID", "Amount", "Date", "Type",
     "Game ID", "Currency", "Status", "Payment Method", "Notes"
 ]
 
@@ -15,36 +17,112 @@ statuses = ["Pending", "Completed", "Failed"]
 payment_methods = ["Credit Card", "Bank Transfer", "PayPal", "Crypto"]
 notes = ["First", "Second", "Third", "Fourth", "Fifth"]
 
-# Function to generate a random date
-def random_date(start, end):
-    return start + timedelta(days=random.randint(0, (end - start).days))
-
-# Get the number of transactions from user input
-num_transactions = int(input("Enter the number of transactions to generate: "))
-
-transactions = []
-start_date = datetime(2023, 1, 1)
-end_date = datetime(2024, 12, 31)
-
-for i in range(num_transactions):
-    transaction = [
-        i + 1001,  # Transaction ID
-        random.randint(500, 1000),  # User ID
-        random.randint(100, 100000),  # Amount
-        random_date(start_date, end_date).strftime("%m/%d/%Y"),  # Date
-        random.choice(transaction_types),  # Type
-        random.randint(100, 200),  # Game ID
-        random.choice(currencies),  # Currency
-        random.choice(statuses),  # Status
-        random.choice(payment_methods),  # Payment Method
-        random.choice(notes)  # Notes
-    ]
-    transactions.append(transaction)
-
-# Write to CSV
-with open('transaction_template.csv', 'w', newline='') as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(headers)
-    writer.writerows(transactions)
-
-print(f"transaction_template.csv has been created with {num_transactions} transactions.")
+DEFAULT_BATCH_SIZE = 500000
+
+
+def parse_date(value):
+    return date.fromisoformat(value)
+
+
+def parse_weights(value):
+    return [float(weight) for weight in value.split(',')]
+
+
+def normalized(weights, choices, name):
+    if weights is None:
+        return None
+    if len(weights) != len(choices):
+        raise ValueError(f"{name} needs {len(choices)} weights ({', '.join(choices)})")
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def pick(rng, choices, weights, size):
+    # Categorical columns are drawn as indices into a small array of strings
+    return np.asarray(choices, dtype=object)[rng.choice(len(choices), size=size, p=weights)]
+
+
+def amounts(rng, size, low, high, distribution):
+    if distribution == 'lognormal':
+        # Many small amounts with a long tail, clipped to the configured range
+        mean = np.log(max(low, 1)) + (np.log(high) - np.log(max(low, 1))) / 4
+        values = rng.lognormal(mean=mean, sigma=1.0, size=size)
+        return np.clip(values.round(), low, high).astype(np.int64)
+    return rng.integers(low, high, size=size, endpoint=True)
+
+
+def generate(rows, output='transaction_template.csv', seed=None, batch_size=DEFAULT_BATCH_SIZE,
+             start_date=date(2023, 1, 1), end_date=date(2024, 12, 31), first_id=1001,
+             user_ids=(500, 1000), game_ids=(100, 200), amount_range=(100, 100000),
+             amount_distribution='uniform', type_weights=None, currency_weights=None,
+             status_weights=None, payment_weights=None):
+    """Write ``rows`` synthetic transactions to ``output``, ``batch_size`` rows at a time.
+
+    The same ``seed`` and arguments always produce the same file.
+    """
+    rng = np.random.default_rng(seed)
+    type_p = normalized(type_weights, transaction_types, 'Type')
+    currency_p = normalized(currency_weights, currencies, 'Currency')
+    status_p = normalized(status_weights, statuses, 'Status')
+    payment_p = normalized(payment_weights, payment_methods, 'Payment Method')
+
+    # Every possible date is formatted once and then looked up by day offset
+    days = (end_date - start_date).days + 1
+    date_strings = np.array([(start_date + timedelta(days=d)).strftime("%m/%d/%Y") for d in range(days)], dtype=object)
+
+    with open(output, 'w', newline='') as csvfile:
+        for start in range(0, rows, batch_size):
+            size = min(batch_size, rows - start)
+            batch = pd.DataFrame({
+                "Transaction ID": np.arange(first_id + start, first_id + start + size),
+                "User ID": rng.integers(user_ids[0], user_ids[1], size=size, endpoint=True),
+                "Amount": amounts(rng, size, amount_range[0], amount_range[1], amount_distribution),
+                "Date": date_strings[rng.integers(0, days, size=size)],
+                "Type": pick(rng, transaction_types, type_p, size),
+                "Game ID": rng.integers(game_ids[0], game_ids[1], size=size, endpoint=True),
+                "Currency": pick(rng, currencies, currency_p, size),
+                "Status": pick(rng, statuses, status_p, size),
+                "Payment Method": pick(rng, payment_methods, payment_p, size),
+                "Notes": pick(rng, notes, None, size),
+            }, columns=headers)
+            batch.to_csv(csvfile, header=(start == 0), index=False, lineterminator='\r\n')
+        if rows == 0:
+            csvfile.write(','.join(headers) + '\r\n')
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic transaction CSV.")
+    parser.add_argument('-n', '--rows', type=int, required=True, help='number of transactions to generate')
+    parser.add_argument('-o', '--output', default='transaction_template.csv', help='output CSV path')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for reproducible output')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='rows generated and written per batch')
+    parser.add_argument('--start-date', type=parse_date, default=date(2023, 1, 1), help='first date (YYYY-MM-DD)')
+    parser.add_argument('--end-date', type=parse_date, default=date(2024, 12, 31), help='last date (YYYY-MM-DD)')
+    parser.add_argument('--first-id', type=int, default=1001, help='first Transaction ID')
+    parser.add_argument('--user-ids', type=int, nargs=2, default=(500, 1000), metavar=('MIN', 'MAX'))
+    parser.add_argument('--game-ids', type=int, nargs=2, default=(100, 200), metavar=('MIN', 'MAX'))
+    parser.add_argument('--amount-range', type=int, nargs=2, default=(100, 100000), metavar=('MIN', 'MAX'))
+    parser.add_argument('--amount-distribution', choices=['uniform', 'lognormal'], default='uniform')
+    parser.add_argument('--type-weights', type=parse_weights, help=f"comma-separated weights for {', '.join(transaction_types)}")
+    parser.add_argument('--currency-weights', type=parse_weights, help=f"comma-separated weights for {', '.join(currencies)}")
+    parser.add_argument('--status-weights', type=parse_weights, help=f"comma-separated weights for {', '.join(statuses)}")
+    parser.add_argument('--payment-weights', type=parse_weights, help=f"comma-separated weights for {', '.join(payment_methods)}")
+    args = parser.parse_args(argv)
+
+    try:
+        generate(
+            args.rows, args.output, seed=args.seed, batch_size=args.batch_size,
+            start_date=args.start_date, end_date=args.end_date, first_id=args.first_id,
+            user_ids=args.user_ids, game_ids=args.game_ids, amount_range=args.amount_range,
+            amount_distribution=args.amount_distribution, type_weights=args.type_weights,
+            currency_weights=args.currency_weights, status_weights=args.status_weights,
+            payment_weights=args.payment_weights)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"{args.output} has been created with {args.rows} transactions.")
+
+
+if __name__ == '__main__':
+    main()